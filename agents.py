@@ -1,56 +1,88 @@
 from abc import ABC, abstractmethod
+import itertools
 import random
-import copy
 import time
+import solver
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from moves import (move_id, id_to_move, move_marks, row_state, DISTANCE, GAIN, PENALTY_ID, PASS_ID, MOVE_IDS,
+                   MOVE_MARKS, VALID_SUMS)
+from odds import WHITE_SUM_PROBABILITY, advance_probability
+from score_sheet import (ScoreSheet, COLOR_INDEX, INCREASING, DECREASING, LOCKED, PENALTY_SHIFT, packed_row,
+                         packed_penalties, pack_row, _mark_delta)
 
 class Agent:
+    # agents that also need the game state passed to choose_move set this
+    needs_state = False
+    # agents whose moves arrive asynchronously implement choose_move_async instead (see server.py)
+    is_async = False
+    # agents that only want the best move by one of the orders of moves.iter_moves set this,
+    # and are asked to choose_from the moves in that order instead
+    move_order = None
+
     def __init__(self):
-        self.score_sheet = {'Red': {'last_number': 0, 'order': 'increasing', 'x_count': 0},
-                            'Yellow': {'last_number': 0, 'order': 'increasing', 'x_count': 0},
-                            'Green': {'last_number': 13, 'order': 'decreasing', 'x_count': 0},
-                            'Blue': {'last_number': 13, 'order': 'decreasing', 'x_count': 0},
-                            'Penalties': 0}
+        self.score_sheet = ScoreSheet()
+
+    def reset(self):
+        """
+        Get ready for a new game: QwixxGame.refresh() keeps its players and resets them, so an
+        agent keeps whatever it learned or cached and only clears what belongs to one game.
+        """
+        self.score_sheet.reset()
 
     def choose_move(self, possible_moves):
         raise NotImplementedError
 
+    def choose_from(self, moves):
+        """Pick a move from an iterator over the legal moves in move_order, best first."""
+        return next(moves)
+
+    def policy_key(self):
+        """
+        Everything besides the rows of its sheet and the legal moves that this agent's choice
+        depends on, or None when its choices can't be reused (see decisions.DecisionCache).
+        """
+        return None
+
+    def choose_moves_batch(self, sheets, move_id_lists):
+        """
+        choose_move for many independent games at once: the index of the chosen move in each
+        game's legal moves, given as moves.move_id ids, when playing that game's sheet.
+        """
+        own_sheet = self.score_sheet
+        choices = []
+        for sheet, move_ids in zip(sheets, move_id_lists):
+            self.score_sheet = sheet
+            choices.append(self.choose_move([id_to_move(action_id) for action_id in move_ids]))
+        self.score_sheet = own_sheet
+        return choices
+
+    @property
+    def name(self):
+        """How results and game output refer to this player."""
+        return self.__class__.__name__
+
     def calculate_score(self):
-        total_score = 0
-        for color, values in self.score_sheet.items():
-            if color != 'Penalties':
-                x_count = values['x_count']
-                row_score = (x_count * (x_count + 1)) // 2
-                total_score += row_score
-        # Deduct 5 points for each penalty
-        total_score -= 5 * self.score_sheet['Penalties']
-        return total_score
+        return self.score_sheet.score()
     
     def update_score_sheet(self, chosen_move):
-        if chosen_move == 'Penalty':
-            self.score_sheet['Penalties'] += 1
+        action_id = MOVE_IDS.get(chosen_move)
+        if action_id == PENALTY_ID:
+            self.score_sheet.penalties += 1
             return
-        if chosen_move == 'Pass':
-            return
-        if type(chosen_move[0]) == int:
-            self.add_number(chosen_move)
-        else:
-            self.add_number(chosen_move[0])
-            self.add_number(chosen_move[1])
+        if action_id is None:
+            # a move without an id, such as a sum of unrolled dice (see moves.move_marks)
+            for number, color in ([chosen_move] if type(chosen_move[0]) == int else chosen_move):
+                self.add_number((number, color))
             return
+        for row, number in MOVE_MARKS[action_id]:
+            self.score_sheet.mark(row, number)
 
     def add_number(self, move):
-        row = self.score_sheet[move[1]]
-        if row['order'] == 'increasing' and move[0] == 12:
-            row['last_number'] = move[0]
-            row['x_count'] += 2
-            row['order'] = 'locked'
-        elif row['order'] == 'decreasing' and move[0] == 2:
-            row['last_number'] = move[0]
-            row['x_count'] += 2
-            row['order'] = 'locked'
-        else:
-            row['last_number'] = move[0]
-            row['x_count'] += 1
+        self.score_sheet.mark(COLOR_INDEX[move[1]], move[0])
 
 class HumanPlayer(Agent):
     def choose_move(self, possible_moves):
@@ -78,55 +110,139 @@ class HumanPlayer(Agent):
             except ValueError:
                 print("Invalid input. Please try again.")
 
+# larger than any score change, used to rule out moves in batched decisions
+UNREACHABLE = 1000
+
+
+class _MoveBatch:
+    """
+    The legal moves of a batch of games flattened into NumPy arrays, for the vectorized
+    choose_moves_batch implementations.
+    """
+    # rows and numbers of the first and second mark of every move id, row -1 when there is no such mark
+    first_row = second_row = first_number = second_number = None
+
+    def __init__(self, sheets, move_id_lists):
+        if _MoveBatch.first_row is None:
+            _MoveBatch.build_tables()
+        lengths = np.fromiter(map(len, move_id_lists), dtype=np.intp, count=len(move_id_lists))
+        self.ids = np.fromiter(itertools.chain.from_iterable(move_id_lists), dtype=np.intp, count=lengths.sum())
+        self.games = np.repeat(np.arange(len(move_id_lists)), lengths)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        self.x_count = np.array([sheet.x_count for sheet in sheets], dtype=np.int64)
+        self.order = np.array([sheet.order for sheet in sheets], dtype=np.int64)
+        self.last_number = np.array([sheet.last_number for sheet in sheets], dtype=np.int64)
+        self.rows = (_MoveBatch.first_row[self.ids], _MoveBatch.second_row[self.ids])
+        self.numbers = (_MoveBatch.first_number[self.ids], _MoveBatch.second_number[self.ids])
+
+    @classmethod
+    def build_tables(cls):
+        marks = [marks + ((-1, 0),) * (2 - len(marks)) for marks in MOVE_MARKS]
+        cls.first_row, cls.first_number = np.array([marks[0] for marks in marks]).T
+        cls.second_row, cls.second_number = np.array([marks[1] for marks in marks]).T
+
+    def row_values(self, values, mark):
+        """values[game, row] for the row of each move's first or second mark (0 where it has none)."""
+        return values[self.games, np.maximum(self.rows[mark], 0)]
+
+    def distances(self, mark):
+        distance = np.abs(self.numbers[mark] - self.row_values(self.last_number, mark))
+        return np.where(self.rows[mark] >= 0, distance, 0)
+
+    def gains(self):
+        """score_delta of every move."""
+        x_count = self.row_values(self.x_count, 0)
+        order = self.row_values(self.order, 0)
+        number = self.numbers[0]
+        locks = ((order == INCREASING) & (number == 12)) | ((order == DECREASING) & (number == 2))
+        new_x_count = x_count + 1 + locks
+        gain = (new_x_count * (new_x_count + 1) - x_count * (x_count + 1)) // 2
+
+        # the second mark goes on its row as the first mark left it when they share a row
+        same_row = self.rows[1] == self.rows[0]
+        x_count = np.where(same_row, new_x_count, self.row_values(self.x_count, 1))
+        order = np.where(same_row & locks, LOCKED, self.row_values(self.order, 1))
+        number = self.numbers[1]
+        locks = ((order == INCREASING) & (number == 12)) | ((order == DECREASING) & (number == 2))
+        new_x_count = x_count + 1 + locks
+        gain += np.where(self.rows[1] >= 0, (new_x_count * (new_x_count + 1) - x_count * (x_count + 1)) // 2, 0)
+        return np.where(self.ids == PENALTY_ID, -5, np.where(self.rows[0] >= 0, gain, 0))
+
+    def first_best(self, values):
+        """Index of the first largest value in each game's moves."""
+        best = np.maximum.reduceat(values, self.offsets)
+        positions = np.arange(len(values))
+        first = np.minimum.reduceat(np.where(values == best[self.games], positions, len(values)), self.offsets)
+        return (first - self.offsets).tolist()
+
+
 class GreedyPlayer(Agent):
+    move_order = GAIN
+
+    def policy_key(self):
+        return self.__class__.__name__
+
     def choose_move(self, possible_moves):
         highest_score = float('-inf')
         best_move_index = None
         
-        # Initialize an empty dictionary to store the original score sheet
-        original_score_sheet = copy.deepcopy(self.score_sheet)
-        
         # Iterate through all possible moves
         for i, move in enumerate(possible_moves):
             
-            self.update_score_sheet(move)
-            score_after_move = self.calculate_score()
+            score_after_move = self.score_sheet.score_delta(move)
             
             if score_after_move > highest_score:
                 highest_score = score_after_move
                 best_move_index = i
-            
-            self.score_sheet = copy.deepcopy(original_score_sheet)
-
-        #restore score sheet to original state
-        self.score_sheet = copy.deepcopy(original_score_sheet)
         
         # Return the index of the move with the highest score
         return best_move_index
 
+    def choose_moves_batch(self, sheets, move_id_lists):
+        if np is None:
+            return super().choose_moves_batch(sheets, move_id_lists)
+        batch = _MoveBatch(sheets, move_id_lists)
+        return batch.first_best(batch.gains())
+
+
+# skip_odds of the "heuristic_greedy_odds" player; it won about 60% of 1000 games against
+# heuristic_greedy, where 0.1 to 0.25 all did better than the fixed distances
+SKIP_ODDS = 0.2
+
 
 class HeuristicGreedyPlayer(Agent):
+    def __init__(self, skip_odds=None):
+        super().__init__()
+        # when set, a mark may skip spaces only if the next roll is less likely than this
+        # to offer a closer number in that row (see odds.py), instead of the fixed distances
+        self.skip_odds = skip_odds
+
+    @property
+    def name(self):
+        # the odds variant is a player type of its own (see QwixxGame.initialize_players)
+        return "HeuristicGreedyOddsPlayer" if self.skip_odds is not None else self.__class__.__name__
+
+    def policy_key(self):
+        return self.__class__.__name__, self.skip_odds
+
     def choose_move(self, possible_moves):
         # Initialize variables to track the best move and its score
         best_move_index = None
         best_score = float('-inf')
         best_distance = float('inf')
-
-        original_score_sheet = copy.deepcopy(self.score_sheet)
         
         # Iterate through all possible moves
-        for i, move in enumerate(possible_moves):
+        action_ids = [MOVE_IDS.get(move) for move in possible_moves]
+        for i, (move, action_id) in enumerate(zip(possible_moves, action_ids)):
             #skip pass or penalty
-            if move == 'Pass' or move == 'Penalty':
+            if action_id == PASS_ID or action_id == PENALTY_ID:
                 continue
 
             # Check if the move satisfies the heuristic constraints
             distance = self.get_dist(move)
             if self.check_constraints(move):
-                # Calculate score after making the move
-                self.score_sheet = copy.deepcopy(original_score_sheet)
-                self.update_score_sheet(move)
-                score_after_move = self.calculate_score()
+                # Calculate score gained by making the move
+                score_after_move = self.score_sheet.score_delta(move)
                 
                 # Check if the score after the move is better than the current best score
                 if score_after_move > best_score or (score_after_move == best_score and distance < best_distance):
@@ -134,31 +250,31 @@ class HeuristicGreedyPlayer(Agent):
                     best_move_index = i
                     best_score = score_after_move
                     best_distance = distance
-
-        #restore score sheet to original state
-        self.score_sheet = copy.deepcopy(original_score_sheet)
         
         # If no move satisfies the constraint, resort to greedy choice
         if best_move_index is None:
-            if 'Pass' in possible_moves:
-                return possible_moves.index('Pass')
+            if PASS_ID in action_ids:
+                return action_ids.index(PASS_ID)
             else:
                 return self.greedy_choice(possible_moves)
         
         return best_move_index
     
-    def check_constraints(self,moves):
-        if type(moves[0]) == int:
+    def check_constraints(self, moves):
+        marks = move_marks(moves)
+        if self.skip_odds is not None:
+            return self.check_odds(moves)
+        if len(marks) == 1:
             #get info
-            number, color = moves
-            last_number = self.score_sheet[color]['last_number']
+            row, number = marks[0]
+            last_number = self.score_sheet.last_number[row]
             distance = abs(number - last_number)
 
             #check constraints
             #override for locking
-            if self.score_sheet[color]['order'] == 'increasing' and number == 12:
+            if self.score_sheet.order[row] == INCREASING and number == 12:
                 return True
-            elif self.score_sheet[color]['order'] == 'decreasing' and number == 2:
+            elif self.score_sheet.order[row] == DECREASING and number == 2:
                 return True
             #regular constraints
             if last_number >= 5 and last_number <= 8:
@@ -169,10 +285,9 @@ class HeuristicGreedyPlayer(Agent):
             else:
                 return False
         else:
-            for move in moves:
+            for row, number in marks:
                 #get info
-                number, color = move
-                last_number = self.score_sheet[color]['last_number']
+                last_number = self.score_sheet.last_number[row]
                 distance = abs(number - last_number)
                 
                 #check constraints
@@ -185,62 +300,87 @@ class HeuristicGreedyPlayer(Agent):
                     return False
             return True
         
-    def get_dist(self,moves):
-        if type(moves[0]) == int:
-            #get info
-            number, color = moves
-            last_number = self.score_sheet[color]['last_number']
-
-            #calculate distance
-            distance = abs(number - last_number)
-            return distance
-        else:
-            overall_dist = 0
-            for move in moves:
-                #get info
-                number, color = move
-                last_number = self.score_sheet[color]['last_number']
-
-                #calculate distance
-                distance = abs(number - last_number)
-                overall_dist += distance
-            return overall_dist
+    def check_odds(self, moves):
+        sheet = self.score_sheet
+        for row, number in move_marks(moves):
+            #override for locking
+            if (sheet.order[row] == INCREASING and number == 12) or (sheet.order[row] == DECREASING and number == 2):
+                continue
+            distance = abs(number - sheet.last_number[row])
+            if advance_probability(sheet, row, distance - 1) >= self.skip_odds:
+                return False
+        return True
+
+    def get_dist(self, moves):
+        # spaces the marks skip, summed over both marks of a pair
+        last_number = self.score_sheet.last_number
+        overall_dist = 0
+        for row, number in move_marks(moves):
+            overall_dist += abs(number - last_number[row])
+        return overall_dist
         
+    def choose_moves_batch(self, sheets, move_id_lists):
+        if np is None or self.skip_odds is not None:
+            return super().choose_moves_batch(sheets, move_id_lists)
+        batch = _MoveBatch(sheets, move_id_lists)
+        gains = batch.gains()
+        first_distance, second_distance = batch.distances(0), batch.distances(1)
+        first_last, second_last = batch.row_values(batch.last_number, 0), batch.row_values(batch.last_number, 1)
+        order = batch.row_values(batch.order, 0)
+        number = batch.numbers[0]
+
+        # check_constraints, for single marks and for pairs
+        locks = ((order == INCREASING) & (number == 12)) | ((order == DECREASING) & (number == 2))
+        single = locks | np.where((first_last >= 5) & (first_last <= 8), first_distance <= 2, first_distance <= 3)
+        # check_constraints only rules out a mark of a pair when its row's last number is outside 5-9
+        pair = (((first_last >= 5) & (first_last <= 9)) | (first_distance <= 3)) & \
+               (((second_last >= 5) & (second_last <= 9)) | (second_distance <= 3))
+        allowed = (batch.rows[0] >= 0) & np.where(batch.rows[1] < 0, single, pair)
+
+        # highest score, then fewest spaces used; distances are at most 22
+        values = np.where(allowed, 64 * gains - first_distance - second_distance, -64 * UNREACHABLE)
+        choices = batch.first_best(values)
+        any_allowed = np.maximum.reduceat(allowed, batch.offsets)
+        if not any_allowed.all():
+            # If no move satisfies the constraint, pass if possible (the last move), else the greedy choice
+            can_pass = np.maximum.reduceat(batch.ids == PASS_ID, batch.offsets)
+            greedy = batch.first_best(gains)
+            for game in np.flatnonzero(~any_allowed).tolist():
+                choices[game] = len(move_id_lists[game]) - 1 if can_pass[game] else greedy[game]
+        return choices
+
     def greedy_choice(self, possible_moves):
         highest_score = float('-inf')
         best_move_index = None
         
-        # Initialize an empty dictionary to store the original score sheet
-        original_score_sheet = copy.deepcopy(self.score_sheet)
-        
         # Iterate through all possible moves
         for i, move in enumerate(possible_moves):
             
-            self.update_score_sheet(move)
-            score_after_move = self.calculate_score()
+            score_after_move = self.score_sheet.score_delta(move)
             
             if score_after_move > highest_score:
                 highest_score = score_after_move
                 best_move_index = i
-            
-            self.score_sheet = copy.deepcopy(original_score_sheet)
-
-        #restore score sheet to original state
-        self.score_sheet = copy.deepcopy(original_score_sheet)
         
         # Return the index of the move with the highest score
         return best_move_index
 
 class HeuristicSpacePlayer(Agent):
+    move_order = DISTANCE
+
+    def policy_key(self):
+        return self.__class__.__name__
+
     def choose_move(self, possible_moves):
             least_distance = float('inf')
             best_move_index = None
             
             # Iterate through all possible moves
             for i, move in enumerate(possible_moves):
-                if move == 'Pass':
+                action_id = MOVE_IDS.get(move)
+                if action_id == PASS_ID:
                     distance = 1
-                elif move == 'Penalty':
+                elif action_id == PENALTY_ID:
                     distance = 13
                 else:
                     distance = self.get_dist(move)
@@ -251,51 +391,226 @@ class HeuristicSpacePlayer(Agent):
             # Return the index of the move with the lowest spaces used
             return best_move_index
 
-    def get_dist(self,moves):
-        if type(moves[0]) == int:
-            #get info
-            number, color = moves
-            last_number = self.score_sheet[color]['last_number']
+    def choose_moves_batch(self, sheets, move_id_lists):
+        if np is None:
+            return super().choose_moves_batch(sheets, move_id_lists)
+        batch = _MoveBatch(sheets, move_id_lists)
+        distance = batch.distances(0) + batch.distances(1)
+        distance = np.where(batch.ids == PASS_ID, 1, np.where(batch.ids == PENALTY_ID, 13, distance))
+        return batch.first_best(-distance)
+
+    def get_dist(self, moves):
+        # spaces the marks skip, summed over both marks of a pair
+        last_number = self.score_sheet.last_number
+        overall_dist = 0
+        for row, number in move_marks(moves):
+            overall_dist += abs(number - last_number[row])
+        return overall_dist
+
+
+# chance of each sum of the two white dice, which every player can use each round
+WHITE_SUM_PROBABILITIES = tuple((white_sum, WHITE_SUM_PROBABILITY[white_sum]) for white_sum in range(2, 13))
+
+
+class LookaheadPlayer(Agent):
+    """
+    Expectimax agent: scores each move by its points plus the expected value of the sheet
+    after the next `depth` rolls of the white dice, which every player can use.
+
+    Rows are searched as packed ints (see ScoreSheet.pack) and evaluated sheets are kept in
+    a transposition table shared by every LookaheadPlayer with the same fill_rate, so it
+    outlives any one player. Leaves are valued by the points the
+    rows could still make if `fill_rate` of their remaining numbers get crossed.
+    At most `max_nodes` new sheets are expanded per decision; past that, moves are
+    valued by the leaf evaluation alone, and values cut short that way are not stored.
+    """
+    # (transpositions, row values, row marks) for each fill_rate
+    shared_tables = {}
+
+    def __init__(self, depth=1, fill_rate=0.5, max_nodes=2000, table_size=1 << 18):
+        super().__init__()
+        self.depth = depth
+        self.fill_rate = fill_rate
+        self.max_nodes = max_nodes
+        self.table_size = table_size
+        self.transpositions, self.row_values, self.row_marks = self.shared_tables.setdefault(fill_rate, ({}, {}, {}))
+        self.nodes = 0
+        # set when the node budget cut the search short, so the value being computed is partial
+        self.truncated = False
+
+    def policy_key(self):
+        # past max_nodes a choice can depend on how much of the search the shared tables already
+        # hold, which a cache settles as the first choice made
+        return self.__class__.__name__, self.depth, self.fill_rate, self.max_nodes
+
+    def row_value(self, field):
+        """Leaf value of one packed row."""
+        value = self.row_values.get(field)
+        if value is None:
+            last_number, order, x_count = packed_row(field, 0)
+            if order == LOCKED:
+                remaining = 0
+            elif order == INCREASING:
+                remaining = 12 - max(last_number, 1)
+            else:
+                remaining = last_number - 2
+            expected = x_count + self.fill_rate * remaining
+            value = self.row_values[field] = (expected * (expected + 1) - x_count * (x_count + 1)) / 2
+        return value
+
+    def row_mark(self, field, number):
+        """(points gained, new packed row) for marking number on a row, or None if it can't be marked."""
+        key = field | number << 12
+        if key not in self.row_marks:
+            last_number, order, x_count = packed_row(field, 0)
+            valid = VALID_SUMS[number][row_state(last_number, order, x_count)]
+            self.row_marks[key] = self.mark_unchecked(field, number) if valid else None
+        return self.row_marks[key]
+
+    @staticmethod
+    def mark_unchecked(field, number):
+        """(points gained, new packed row) for marking number on a row as ScoreSheet.mark would."""
+        _, order, x_count = packed_row(field, 0)
+        gain, x_count, order = _mark_delta(x_count, order, number)
+        return gain, pack_row(number, order, x_count)
+
+    def sheet_value(self, rows, depth):
+        """Expected value of a sheet of packed rows (penalties left out) over the next depth rolls."""
+        key = rows | depth << 48
+        value = self.transpositions.get(key)
+        if value is not None:
+            return value
+        fields = [(rows >> (12 * row)) & 0xFFF for row in range(4)]
+        values = [self.row_value(field) for field in fields]
+        leaf = values[0] + values[1] + values[2] + values[3]
+        if depth == 0:
+            return leaf
+        if self.nodes >= self.max_nodes:
+            self.truncated = True
+            return leaf
+
+        self.nodes += 1
+        truncated, self.truncated = self.truncated, False
+        value = 0
+        passing = self.sheet_value(rows, depth - 1) if depth > 1 else leaf
+        for white_sum, probability in WHITE_SUM_PROBABILITIES:
+            best = passing
+            for row in range(4):
+                mark = self.row_mark(fields[row], white_sum)
+                if mark is not None:
+                    gain, field = mark
+                    if depth == 1:
+                        # only one row changes, so the leaf value can be updated in place
+                        option = gain + leaf - values[row] + self.row_value(field)
+                    else:
+                        option = gain + self.sheet_value(rows & ~(0xFFF << (12 * row)) | field << (12 * row), depth - 1)
+                    if option > best:
+                        best = option
+            value += probability * best
+
+        # a value that used leaf evaluations in place of cut-off searches depends on the budget left
+        if not self.truncated:
+            if len(self.transpositions) >= self.table_size:
+                self.transpositions.clear()
+            self.transpositions[key] = value
+        self.truncated = self.truncated or truncated
+        return value
+
+    def apply(self, rows, move):
+        """Packed rows after move, and the points it scores."""
+        action_id = move_id(move)
+        if action_id == PENALTY_ID:
+            return rows, -5
+        points = 0
+        for row, number in MOVE_MARKS[action_id]:
+            field = (rows >> (12 * row)) & 0xFFF
+            mark = self.row_mark(field, number)
+            if mark is None:
+                # a second mark the first one made invalid; score it like update_score_sheet would
+                mark = self.mark_unchecked(field, number)
+            gain, field = mark
+            points += gain
+            rows = rows & ~(0xFFF << (12 * row)) | field << (12 * row)
+        return rows, points
 
-            #calculate distance
-            distance = abs(number - last_number)
-            return distance
-        else:
-            overall_dist = 0
-            for move in moves:
-                #get info
-                number, color = move
-                last_number = self.score_sheet[color]['last_number']
+    def choose_move(self, possible_moves):
+        rows = self.score_sheet.pack() & ((1 << PENALTY_SHIFT) - 1)
+        self.nodes = 0
+        self.truncated = False
+        best_value = float('-inf')
+        best_move_index = None
+        for i, move in enumerate(possible_moves):
+            new_rows, points = self.apply(rows, move)
+            value = points + self.sheet_value(new_rows, self.depth)
+            if value > best_value:
+                best_value = value
+                best_move_index = i
+        return best_move_index
 
-                #calculate distance
-                distance = abs(number - last_number)
-                overall_dist += distance
-            return overall_dist
+
+class TablePlayer(Agent):
+    """
+    Plays by the exact solitaire values of solver.py: a move is worth its points plus the value
+    of the sheet it leaves, read from the table with one index.
+
+    The table is built offline (python solver.py OUTPUT) and memory-mapped, by default once per
+    process from solver.TABLE_PATH; pass values from solver.load_values to use another one.
+    """
+    def __init__(self, values=None):
+        super().__init__()
+        self.values = solver.shared_values() if values is None else values
+
+    def policy_key(self):
+        # its values depend on the penalties, which decisions.DecisionCache keys leave out
+        return None
+
+    def move_value(self, move, rows):
+        """Value of move from the solver row states of the sheet (see solver.sheet_rows)."""
+        penalties = self.score_sheet.penalties
+        action_id = move_id(move)
+        if action_id == PENALTY_ID:
+            return -5 + solver.sheet_value(self.values, rows, penalties + 1)
+        points, new_rows = solver.apply_marks(rows, MOVE_MARKS[action_id])
+        return points + solver.sheet_value(self.values, new_rows, penalties)
+
+    def choose_move(self, possible_moves):
+        rows = solver.sheet_rows(self.score_sheet)
+        best_value = float('-inf')
+        best_move_index = None
+        for i, move in enumerate(possible_moves):
+            value = self.move_value(move, rows)
+            if value > best_value:
+                best_value = value
+                best_move_index = i
+        return best_move_index
+
+
+def state_to_partition(state):
+    """Coarse partition of a QwixxGame.get_state_key() state used as the Q-learning state."""
+    sheets = state[2]
+    max_penalties = max(max(packed_penalties(sheet) for sheet in sheets), 1)
+    rows_locked = sum(1 for sheet in sheets for row in range(4) if packed_row(sheet, row)[1] == LOCKED)
+
+    # Calculate X counts for each row and player
+    x_counts = []
+    for sheet in sheets:
+        x_counts.append(tuple(packed_row(sheet, row)[2] // 3 for row in range(4)))
+
+    partition = (max_penalties // 2) + rows_locked, tuple(x_counts)
+    return partition
 
 
 class QLearnPlayer(Agent):
-    def __init__(self, game):
+    needs_state = True
+
+    def __init__(self, game, q_table=None):
         super().__init__()
         self.game = game
-        self.learned = False
+        # a pre-trained qlearning.QTable, used instead of learning on the first move
+        self.q_table = q_table
+        self.learned = q_table is not None
 
     def q_learn(self, time_limit, gamma=0.99, epsilon=0.1, alpha_initial=0.3, alpha_decay=0.995):
-        def state_to_partition(state):
-            max_penalties = max(max(score_sheet['Penalties'] for score_sheet in state['player_scores']), 1)
-            rows_locked = sum(1 for player in state['player_scores'] for color in ['Red', 'Yellow', 'Green', 'Blue'] if player[color]['order'] == 'locked')
-
-            # Calculate X counts for each row and player
-            x_counts = []
-            for player in state['player_scores']:
-                player_x_counts = []
-                for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                    x_count = player[color]['x_count'] // 3
-                    player_x_counts.append(x_count)
-                x_counts.append(tuple(player_x_counts))
-
-            partition = (max_penalties // 2) + rows_locked, tuple(x_counts)
-            return partition
-        
         def epsilon_greedy_policy(state, possible_moves):
             partition_s = state_to_partition(state)
             if random.random() < epsilon:
@@ -314,7 +629,7 @@ class QLearnPlayer(Agent):
         while elapsed_time < time_limit:
             self.game.refresh()
             while not self.game.check_end_conditions():
-                state = self.game.get_state_representation()
+                state = self.game.get_state_key()
                 possible_moves = self.game.get_possible_moves(self)
                 action = epsilon_greedy_policy(state, possible_moves)
                 next_state = self.game.take_action(self,action)
@@ -351,6 +666,9 @@ class QLearnPlayer(Agent):
         return policy
 
     def choose_move(self, possible_moves, state):
+        if self.q_table is not None:
+            return self.q_table.best(state_to_partition(state), [move_id(move) for move in possible_moves])
+
         # Implement Q-learning
         if self.learned == False:
             self.policy = self.q_learn(time_limit=10)  # Set time limit as needed
@@ -0,0 +1,247 @@
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from dice import DiceStream
+from moves import id_to_move, VALID_SUMS
+from qwixx import QwixxGame
+from score_sheet import INCREASING, DECREASING, LOCKED, LOCK_NUMBER
+
+# agents the batch engine can play, with the class whose decision rule it follows
+BATCH_AGENTS = {'greedy': 'GreedyPlayer', 'heuristic_space': 'HeuristicSpacePlayer'}
+
+# Every game offers the same fixed list of move slots, valid or not:
+#   0-3    white sum on row r
+#   4-11   white die k plus the colored die of row r, slot 4 + 2 * r + k
+#   12-43  white sum on row r then colored slot c, slot 12 + 8 * r + (c - 4)
+#   44     penalty (active player only)
+#   45     pass (inactive players only)
+N_WHITE = 4
+N_COLORED = 8
+COMBO = N_WHITE + N_COLORED
+PENALTY = COMBO + N_WHITE * N_COLORED
+PASS = PENALTY + 1
+N_SLOTS = PASS + 1
+
+# larger than any gain or distance, used to rule out invalid slots
+UNREACHABLE = 1000
+
+
+def _triangle(x_count):
+    return x_count * (x_count + 1) // 2
+
+
+class BatchQwixx:
+    """
+    Plays many independent games in lockstep, holding every game's state in NumPy arrays.
+
+    Supports the decision rules of GreedyPlayer and HeuristicSpacePlayer, given by
+    player_types as in QwixxGame. Ties between equally good moves are broken by slot order
+    rather than by the order of get_possible_moves, so results match QwixxGame up to tie-breaking.
+    State arrays are (players, games, 4) and only hold the games still being played.
+    """
+
+    def __init__(self, *player_types, seed=None):
+        if np is None:
+            raise ImportError("BatchQwixx requires numpy")
+        for player_type in player_types:
+            if player_type.lower() not in BATCH_AGENTS:
+                raise ValueError(f"batch engine cannot play {player_type!r}, options are {list(BATCH_AGENTS)}")
+        self.player_types = player_types
+        self.names = [BATCH_AGENTS[player_type.lower()] for player_type in player_types]
+        self.greedy = [player_type.lower() == 'greedy' for player_type in player_types]
+        self.rng = np.random.default_rng(seed)
+
+        # moves.VALID_SUMS as an array indexed [number, row state], and the number locking a row of each order
+        self.valid_sums = np.array(VALID_SUMS, dtype=bool)
+        self.lock_number = np.array(LOCK_NUMBER + (-1,), dtype=np.int16)
+
+        # each slot's marks as a row and a column of the round's single marks (the white sum on
+        # each row, then the colored sums); the second row is -1 when there is no second mark
+        colored_row = np.repeat(np.arange(4), 2)
+        combo_white_row = np.repeat(np.arange(4), N_COLORED)
+        combo_colored = np.tile(np.arange(N_COLORED), N_WHITE)
+        no_mark = np.zeros(2, dtype=int)
+        self.first_row = np.concatenate([np.arange(4), colored_row, combo_white_row, no_mark])
+        self.first_single = np.concatenate([np.arange(COMBO), combo_white_row, no_mark])
+        self.second_row = np.concatenate([np.full(COMBO, -1), colored_row[combo_colored], no_mark - 1])
+        self.second_single = np.concatenate([np.zeros(COMBO, dtype=int), N_WHITE + combo_colored, no_mark])
+        # combo slots (counted from COMBO) whose marks share a row: colored sum k on row k // 2
+        self.same_row_combos = np.flatnonzero(colored_row[combo_colored] == combo_white_row)
+        self.colored_white = np.tile([4, 5], 4)
+        self.colored_row = colored_row
+
+    def play(self, games):
+        """Play `games` games and return their final scores as a (games, players) array."""
+        players = len(self.player_types)
+        self.last_number = np.tile(np.array([0, 0, 13, 13], dtype=np.int16), (players, games, 1))
+        self.x_count = np.zeros((players, games, 4), dtype=np.int16)
+        self.order = np.tile(np.array([INCREASING, INCREASING, DECREASING, DECREASING], dtype=np.int16),
+                             (players, games, 1))
+        self.penalties = np.zeros((players, games), dtype=np.int16)
+        self.active_player_index = 0
+        # index of each game still in the state arrays; finished games are dropped from them
+        self.game_ids = np.arange(games)
+        scores = np.zeros((games, players), dtype=np.int32)
+
+        while len(self.game_ids):
+            self.play_round()
+
+            #update all players scoresheets to reflect locked rows
+            locked = (self.order == LOCKED).any(axis=0)
+            self.order[:, locked] = LOCKED
+
+            # end conditions for every game at once
+            over = (self.penalties >= 4).any(axis=0) | (locked.sum(axis=1) >= 2)
+            if over.any():
+                scores[self.game_ids[over]] = self.scores(over)
+                self.keep(~over)
+
+        return scores
+
+    def scores(self, games=slice(None)):
+        """Scores of games in the state arrays, as (games, players)."""
+        x_count = self.x_count[:, games].astype(np.int32)
+        return (_triangle(x_count).sum(axis=2) - 5 * self.penalties[:, games]).T
+
+    def keep(self, games):
+        self.last_number = self.last_number[:, games]
+        self.x_count = self.x_count[:, games]
+        self.order = self.order[:, games]
+        self.penalties = self.penalties[:, games]
+        self.game_ids = self.game_ids[games]
+
+    def roll_dice(self, games):
+        # one draw for the whole batch: colored dice in row order, then the two white dice
+        return self.rng.integers(1, 7, size=(games, 6), dtype=np.int16)
+
+    def play_round(self):
+        players = len(self.player_types)
+        dice = self.roll_dice(len(self.game_ids))
+        white_sum = dice[:, 4] + dice[:, 5]
+        colored_sum = dice[:, self.colored_white] + dice[:, self.colored_row]
+        singles = np.concatenate([np.repeat(white_sum[:, None], N_WHITE, axis=1), colored_sum], axis=1)
+        # every player decides on the same dice and rows only lock at the end of the round,
+        # so seats can be played one after another
+        for seat in range(players):
+            if seat == self.active_player_index:
+                choice = self.active_choice(seat, white_sum, colored_sum)
+            else:
+                choice = self.inactive_choice(seat, white_sum)
+            self.apply_moves(seat, choice, singles)
+        self.active_player_index = (self.active_player_index + 1) % players
+
+    def mark_values(self, seat, numbers):
+        """
+        What marking numbers (games, 4, k) on each row of seat's sheets is worth to its agent, as
+        (games, 4, k): the points it scores for greedy, the spaces it uses for heuristic_space.
+        Marks that are not legal are worth -UNREACHABLE and UNREACHABLE respectively.
+        """
+        last_number, x_count, order = self.last_number[seat], self.x_count[seat], self.order[seat]
+        state = (order * 14 + last_number) * 2 + (x_count >= 5)
+        valid = self.valid_sums[numbers, state[:, :, None]]
+        if self.greedy[seat]:
+            # marking the last number of a row crosses it twice and locks the row
+            x_count = x_count[:, :, None]
+            gain = np.where(numbers == self.lock_number[order][:, :, None], 2 * x_count + 3, x_count + 1)
+            return np.where(valid, gain, -UNREACHABLE)
+        return np.where(valid, np.abs(numbers - last_number[:, :, None]), UNREACHABLE)
+
+    def inactive_choice(self, seat, white_sum):
+        # an inactive player can only mark the white sum on one row, or pass
+        values = self.mark_values(seat, white_sum[:, None, None])[:, :, 0]
+        if self.greedy[seat]:
+            # passing scores nothing and every mark scores, so it is only chosen when nothing can be marked
+            return np.where(values.max(axis=1) > 0, values.argmax(axis=1), PASS)
+        # passing counts as one space; a mark that close comes first in slot order
+        return np.where(values.min(axis=1) <= 1, values.argmin(axis=1), PASS)
+
+    def active_choice(self, seat, white_sum, colored_sum):
+        games = len(white_sum)
+        greedy = self.greedy[seat]
+        # the white sum on every row, and each colored sum on its own row
+        white = self.mark_values(seat, white_sum[:, None, None])[:, :, 0]
+        colored = self.mark_values(seat, colored_sum.reshape(games, 4, 2)).reshape(games, N_COLORED)
+
+        # a white mark then a colored mark, both checked against the sheet before the move as in
+        # get_possible_moves, so their values add up; an illegal mark keeps the pair out of reach
+        combo = (white[:, :, None] + colored[:, None, :]).reshape(games, -1)
+        same, rows = self.same_row_combos, self.colored_row
+        # the same number twice on one row is the same mark
+        repeated = colored_sum == white_sum[:, None]
+        if greedy:
+            # on the same row, the colored mark goes on the row as the white mark left it
+            lock_number = self.lock_number[self.order[seat][:, rows]]
+            white_locks = white_sum[:, None] == lock_number
+            x_count = self.x_count[seat][:, rows] + 1 + white_locks
+            second = np.where((colored_sum == lock_number) & ~white_locks, 2 * x_count + 3, x_count + 1)
+            legal = (white[:, rows] > 0) & (colored > 0) & ~repeated
+            combo[:, same] = np.where(legal, white[:, rows] + second, -UNREACHABLE)
+            values = np.concatenate([white, colored, combo, np.full((games, 1), -5, dtype=combo.dtype)], axis=1)
+            return values.argmax(axis=1)
+        combo[:, same] = np.where(repeated, UNREACHABLE, combo[:, same])
+        values = np.concatenate([white, colored, combo, np.full((games, 1), 13, dtype=combo.dtype)], axis=1)
+        return values.argmin(axis=1)
+
+    def apply_moves(self, seat, choice, singles):
+        self.penalties[seat, choice == PENALTY] += 1
+
+        games = np.flatnonzero(choice < PENALTY)
+        slots = choice[games]
+        self.mark(seat, games, self.first_row[slots], singles[games, self.first_single[slots]])
+        second = self.second_row[slots] >= 0
+        games, slots = games[second], slots[second]
+        self.mark(seat, games, self.second_row[slots], singles[games, self.second_single[slots]])
+
+    def mark(self, seat, games, rows, numbers):
+        order = self.order[seat, games, rows]
+        locks = numbers == self.lock_number[order]
+        self.x_count[seat, games, rows] += 1 + locks
+        self.order[seat, games, rows] = np.where(locks, LOCKED, order)
+        self.last_number[seat, games, rows] = numbers
+
+
+def play_lockstep(player_types, games, seed=0):
+    """
+    Play `games` QwixxGames round by round together, asking each seat's agent for its move in
+    every game with one Agent.choose_moves_batch call.
+
+    Game i rolls from DiceStream(seed).spawn(i), so each game is the same as playing it alone.
+    Returns the final scores of every game, in game order.
+    """
+    # a game only rolls a few dozen times, so each game's stream draws small blocks
+    dice_source = DiceStream(seed, block_size=64)
+    boards = [QwixxGame(*player_types, dice_source=dice_source.spawn(index)) for index in range(games)]
+    # every game shares the deciding agents of the first one, which decide on each game's sheets
+    agents = boards[0].players
+    if any(agent.needs_state or agent.is_async for agent in agents):
+        raise ValueError("play_lockstep cannot play agents that need the game state or decide asynchronously")
+    scores = [None] * games
+    live = list(range(games))
+    active_index = 0
+    while live:
+        for index in live:
+            boards[index].roll_dice()
+
+        # Active Player first, then the inactive players in seat order
+        for seat in [active_index] + [seat for seat in range(len(agents)) if seat != active_index]:
+            players = [boards[index].players[seat] for index in live]
+            move_id_lists = [boards[index].get_possible_move_ids(player) for index, player in zip(live, players)]
+            choices = agents[seat].choose_moves_batch([player.score_sheet for player in players], move_id_lists)
+            for index, player, move_ids, choice in zip(live, players, move_id_lists, choices):
+                player.update_score_sheet(id_to_move(move_ids[choice]))
+                boards[index].sheet_changed(player)
+
+        active_index = (active_index + 1) % len(agents)
+        still_live = []
+        for index in live:
+            game = boards[index]
+            game.active_player_index = active_index
+            game.lock()
+            if game.check_end_conditions():
+                scores[index] = [game.calculate_score(player) for player in game.players]
+            else:
+                still_live.append(index)
+        live = still_live
+    return scores
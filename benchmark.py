@@ -0,0 +1,199 @@
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+
+from agents import GreedyPlayer, HeuristicGreedyPlayer, HeuristicSpacePlayer, LookaheadPlayer
+from dice import DiceStream
+from qwixx import QwixxGame, GameObserver
+
+# Every benchmark plays from fixed seeds, so two runs do the same work, and reports its best rate over REPEATS runs
+SEED = 474
+REPEATS = 5
+THRESHOLD = 0.1
+# matchups timed end to end with QwixxGame.play
+MATCHUPS = (("greedy", "greedy"),
+            ("heuristic_space", "heuristic_greedy", "greedy"),
+            ("lookahead", "heuristic_greedy"))
+# agents whose choose_move is timed on recorded positions
+AGENTS = {"greedy": GreedyPlayer, "heuristic_greedy": HeuristicGreedyPlayer,
+          "heuristic_space": HeuristicSpacePlayer, "lookahead": LookaheadPlayer}
+
+
+class PositionRecorder(GameObserver):
+    """Keeps every decision of a game: the deciding player's sheet, the dice, and whether it was their turn."""
+    def __init__(self):
+        self.positions = []
+
+    def move_chosen(self, game, player, move):
+        # the sheet is only updated after this event, so it is the one the move was chosen on
+        active = game.players[game.active_player_index] is player
+        self.positions.append((player.score_sheet.copy(), game.dice_values, active))
+
+
+def record_positions(games, seed=SEED):
+    recorder = PositionRecorder()
+    random.seed(seed)
+    game = QwixxGame("heuristic_space", "heuristic_greedy", "greedy", dice_source=DiceStream(seed), observer=recorder)
+    for _ in range(games):
+        game.play()
+    return recorder.positions
+
+
+def cold_start():
+    # LookaheadPlayer keeps its transposition tables across players, so every repeat would
+    # otherwise time lookups of the sheets earlier repeats searched
+    LookaheadPlayer.shared_tables.clear()
+
+
+def measure(run, operations, repeats=REPEATS):
+    """Best time of `repeats` calls to run(), as a result entry for `operations` operations per call."""
+    best = float('inf')
+    for _ in range(repeats):
+        cold_start()
+        start = time.perf_counter()
+        run()
+        best = min(best, time.perf_counter() - start)
+    return {"operations": operations, "seconds": best, "rate": operations / best}
+
+
+def bench_play(player_types, games, seed=SEED):
+    def run():
+        random.seed(seed)
+        game = QwixxGame(*player_types, dice_source=DiceStream(seed))
+        for _ in range(games):
+            game.play()
+    return measure(run, games)
+
+
+def position_game(positions):
+    """A two-player game with each position's sheet and dice set up for players[0], ready to query."""
+    game = QwixxGame("greedy", "greedy")
+    player = game.players[0]
+    setups = []
+    for sheet, dice_values, active in positions:
+        player.score_sheet = sheet
+        game.active_player_index = 0 if active else 1
+        for die, value in zip(game.dice, dice_values):
+            die.value = value
+        setups.append((sheet, dice_values, active, game.get_possible_moves(player)))
+    return game, setups
+
+
+def bench_possible_moves(game, setups):
+    player = game.players[0]
+    dice = game.dice
+
+    def run():
+        for sheet, dice_values, active, _ in setups:
+            player.score_sheet = sheet
+            game.active_player_index = 0 if active else 1
+            for die, value in zip(dice, dice_values):
+                die.value = value
+            game.get_possible_moves(player)
+    return measure(run, len(setups))
+
+
+def bench_check_valid_move(game, setups):
+    # the checks the original move generation made: the white dice, then every white and colored pair
+    dice = game.dice
+    checks = 12 * len(setups)
+
+    def run():
+        for sheet, dice_values, _, _ in setups:
+            for die, value in zip(dice, dice_values):
+                die.value = value
+            for row, color in enumerate(("Red", "Yellow", "Green", "Blue")):
+                row_view = sheet[color]
+                game.check_valid_move(1, row_view, dice[4], dice[5])
+                game.check_valid_move(2, row_view, dice[4], dice[row])
+                game.check_valid_move(2, row_view, dice[5], dice[row])
+    return measure(run, checks)
+
+
+def bench_choose_move(agent_class, setups):
+    def run():
+        # a new agent each repeat, so it holds no tables from the previous one
+        agent = agent_class()
+        for sheet, _, _, possible_moves in setups:
+            agent.score_sheet = sheet
+            agent.choose_move(possible_moves)
+    return measure(run, len(setups))
+
+
+def bench_calculate_score(setups):
+    agent = GreedyPlayer()
+
+    def run():
+        for sheet, _, _, _ in setups:
+            agent.score_sheet = sheet
+            agent.calculate_score()
+    return measure(run, len(setups))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(games=200, positions=50, seed=SEED):
+    """Run every benchmark and return the results, keyed by benchmark name."""
+    results = {}
+    for player_types in MATCHUPS:
+        # lookahead is far slower per game than the other agents
+        matchup_games = games // 10 if "lookahead" in player_types else games
+        results["play/" + "-".join(player_types)] = bench_play(player_types, matchup_games, seed)
+
+    game, setups = position_game(record_positions(positions, seed))
+    results["get_possible_moves"] = bench_possible_moves(game, setups)
+    results["check_valid_move"] = bench_check_valid_move(game, setups)
+    for name, agent_class in AGENTS.items():
+        results["choose_move/" + name] = bench_choose_move(agent_class, setups)
+    results["calculate_score"] = bench_calculate_score(setups)
+    return results
+
+
+def compare(previous, current, threshold=THRESHOLD):
+    """Names of benchmarks whose rate dropped by more than threshold, with both rates."""
+    regressions = []
+    for name, result in current.items():
+        if name in previous and result["rate"] < previous[name]["rate"] * (1 - threshold):
+            regressions.append((name, previous[name]["rate"], result["rate"]))
+    return regressions
+
+
+if __name__ == "__main__":
+    # usage: python benchmark.py [--output FILE] [--compare FILE] [--threshold FRACTION] [--quick]
+    # --compare reads an earlier --output file and exits with status 1 if any rate dropped by more than the threshold
+    args = sys.argv[1:]
+    options = {"--output": None, "--compare": None, "--threshold": THRESHOLD}
+    for option in options:
+        if option in args:
+            position = args.index(option)
+            options[option] = args[position + 1]
+            del args[position:position + 2]
+    quick = "--quick" in args
+
+    results = run_benchmarks(games=20 if quick else 200, positions=5 if quick else 50)
+    report = {"commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+              "seed": SEED, "results": results}
+    for name, result in results.items():
+        print(f"{name:45} {result['rate']:12.1f}/s")
+
+    if options["--output"] is not None:
+        with open(options["--output"], "w") as file:
+            json.dump(report, file, indent=2)
+
+    if options["--compare"] is not None:
+        with open(options["--compare"]) as file:
+            previous = json.load(file)
+        regressions = compare(previous["results"], results, float(options["--threshold"]))
+        for name, before, after in regressions:
+            print(f"Regression in {name}: {before:.1f}/s -> {after:.1f}/s")
+        if regressions:
+            sys.exit(1)
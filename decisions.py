@@ -0,0 +1,85 @@
+import pickle
+from collections import OrderedDict
+
+from moves import move_id
+from score_sheet import PENALTY_SHIFT
+
+# default bound on the number of decisions a cache keeps
+CACHE_SIZE = 1 << 20
+# the rows of a packed sheet, without its penalties
+ROWS_MASK = (1 << PENALTY_SHIFT) - 1
+
+
+class DecisionCache:
+    """
+    Size-bounded LRU cache of the moves deterministic agents chose, keyed by the agent's
+    policy_key(), the rows of its packed sheet and the ids of its legal moves.
+
+    wrap() makes an agent look its choices up here before deciding. The cache can be saved
+    and loaded again, so later runs start with the decisions of earlier ones.
+    """
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # (key, choice) of every decision added, while this is a list (see tournament.play_chunk)
+        self.added = None
+
+    def __len__(self):
+        return len(self.entries)
+
+    def wrap(self, agent):
+        """Cache agent's choose_move, if its choices only depend on its sheet and moves; returns agent."""
+        policy = agent.policy_key()
+        if policy is None or agent.needs_state or agent.is_async:
+            return agent
+        choose_move = agent.choose_move
+        entries = self.entries
+
+        def cached_choose_move(possible_moves):
+            key = (policy, agent.score_sheet.pack() & ROWS_MASK, tuple([move_id(move) for move in possible_moves]))
+            choice = entries.get(key)
+            if choice is not None:
+                self.hits += 1
+                entries.move_to_end(key)
+                return choice
+            self.misses += 1
+            choice = entries[key] = choose_move(possible_moves)
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+            if self.added is not None:
+                self.added.append((key, choice))
+            return choice
+
+        agent.choose_move = cached_choose_move
+        # the cache needs the whole move list, so the agent no longer reads moves lazily
+        agent.move_order = None
+        return agent
+
+    def update(self, decisions):
+        """Add (key, choice) pairs, as the most recently used entries."""
+        entries = self.entries
+        for key, choice in decisions:
+            entries[key] = choice
+            entries.move_to_end(key)
+        while len(entries) > self.maxsize:
+            entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries)}
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump((self.maxsize, list(self.entries.items())), file)
+
+    @classmethod
+    def load(cls, path, maxsize=None):
+        """A cache holding the decisions saved at path, least recently used first."""
+        with open(path, 'rb') as file:
+            saved_maxsize, entries = pickle.load(file)
+        cache = cls(maxsize if maxsize is not None else saved_maxsize)
+        cache.entries.update(entries[-cache.maxsize:])
+        return cache
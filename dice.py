@@ -1,9 +1,59 @@
 import random
 
+FACES = (1, 2, 3, 4, 5, 6)
+
 class Dice:
     def __init__(self, color):
         self.color = color
         self.value = 0
 
     def roll(self):
-        self.value = random.randint(1, 6)
\ No newline at end of file
+        self.value = random.randint(1, 6)
+
+
+class DiceStream:
+    """
+    Source of rolls for all six dice (colored dice in row order, then the two white dice).
+
+    Rolls are drawn from a private random.Random in blocks of block_size rolls, so a
+    stream is reproducible from its seed and does not touch the global random module.
+    """
+    def __init__(self, seed=None, block_size=1024, record=False):
+        if seed is None:
+            seed = random.SystemRandom().getrandbits(64)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.block_size = block_size
+        self.block = []
+        self.position = 0
+        # every roll handed out, when recording, so the sequence can be replayed with ReplayDice
+        self.history = [] if record else None
+
+    def spawn(self, index):
+        """Independent stream whose seed depends only on this stream's seed and index."""
+        return DiceStream(f"{self.seed}/{index}", self.block_size, self.history is not None)
+
+    def roll(self):
+        if self.position == len(self.block):
+            values = iter(self.rng.choices(FACES, k=6 * self.block_size))
+            self.block = list(zip(values, values, values, values, values, values))
+            self.position = 0
+        values = self.block[self.position]
+        self.position += 1
+        if self.history is not None:
+            self.history.append(values)
+        return values
+
+
+class ReplayDice:
+    """Plays back a recorded sequence of rolls, e.g. DiceStream.history."""
+    def __init__(self, rolls):
+        self.rolls = [tuple(values) for values in rolls]
+        self.position = 0
+
+    def roll(self):
+        if self.position == len(self.rolls):
+            raise IndexError("no recorded rolls left to replay")
+        values = self.rolls[self.position]
+        self.position += 1
+        return values
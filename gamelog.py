@@ -0,0 +1,120 @@
+import struct
+from collections import namedtuple
+
+from moves import move_id, id_to_move
+from qwixx import GameObserver
+
+# Append-only binary game log written by GameRecorder and read by read_records:
+#   header     LOG_MAGIC and the format version, once at the start of the file
+#   then per game:
+#     start    record type, player count, then each player's class name as a length-prefixed UTF-8 string
+#     decision record type, seat (top bit set for the active player), the six dice values,
+#              number of legal moves, moves.move_id of the chosen move, change in that player's score
+#     end      record type, player count, then each final score
+# Integers are little-endian; a decision record is DECISION.size bytes.
+LOG_MAGIC = b'QWXL'
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct('<4sB')
+GAME_START, DECISION_RECORD, GAME_END = 0, 1, 2
+RECORD_TYPE = struct.Struct('<B')
+DECISION = struct.Struct('<B6BBHb')
+ACTIVE_FLAG = 0x80
+
+GameStart = namedtuple('GameStart', ['names'])
+Decision = namedtuple('Decision', ['seat', 'active', 'dice', 'legal_moves', 'move_id', 'score_delta'])
+GameEnd = namedtuple('GameEnd', ['scores'])
+GameRecord = namedtuple('GameRecord', ['names', 'decisions', 'scores'])
+
+
+class GameRecorder(GameObserver):
+    """
+    Observer that appends one record per decision of every game it watches to a binary log.
+
+    Records are buffered by the file, so call close() (or use it as a context manager) when done.
+    """
+    def __init__(self, path):
+        self.file = open(path, 'ab')
+        if self.file.tell() == 0:
+            self.file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self.file.close()
+
+    def game_started(self, game):
+        record = bytearray(RECORD_TYPE.pack(GAME_START))
+        record.append(len(game.players))
+        for player in game.players:
+            name = player.name.encode()
+            record.append(len(name))
+            record += name
+        self.file.write(record)
+
+    def move_chosen(self, game, player, move):
+        # the sheet is only updated after this event, so the legal moves and the delta are the ones it chose from
+        seat = game.players.index(player)
+        if game.players[game.active_player_index] is player:
+            seat |= ACTIVE_FLAG
+        self.file.write(RECORD_TYPE.pack(DECISION_RECORD)
+                        + DECISION.pack(seat, *game.dice_values, len(game.get_possible_moves(player)),
+                                        move_id(move), player.score_sheet.score_delta(move)))
+
+    def game_ended(self, game, scores):
+        self.file.write(RECORD_TYPE.pack(GAME_END) + struct.pack(f'<B{len(scores)}h', len(scores), *scores))
+
+
+def read_records(path):
+    """Yield every record of a log in order, as GameStart, Decision and GameEnd tuples."""
+    with open(path, 'rb') as file:
+        magic, version = LOG_HEADER.unpack(file.read(LOG_HEADER.size))
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} game log")
+        read = file.read
+        while True:
+            record_type = read(1)
+            if not record_type:
+                return
+            record_type = record_type[0]
+            if record_type == DECISION_RECORD:
+                seat, *dice, legal_moves, action_id, delta = DECISION.unpack(read(DECISION.size))
+                yield Decision(seat & ~ACTIVE_FLAG, bool(seat & ACTIVE_FLAG), tuple(dice), legal_moves, action_id,
+                               delta)
+            elif record_type == GAME_START:
+                names = []
+                for _ in range(read(1)[0]):
+                    names.append(read(read(1)[0]).decode())
+                yield GameStart(names)
+            elif record_type == GAME_END:
+                players = read(1)[0]
+                yield GameEnd(list(struct.unpack(f'<{players}h', read(2 * players))))
+            else:
+                raise ValueError(f"unknown record type {record_type} in {path}")
+
+
+def read_games(path):
+    """Yield each complete game in a log as a GameRecord, holding only one game in memory at a time."""
+    names = None
+    decisions = []
+    for record in read_records(path):
+        if type(record) is Decision:
+            decisions.append(record)
+        elif type(record) is GameStart:
+            names = record.names
+            decisions = []
+        else:
+            yield GameRecord(names, decisions, record.scores)
+
+
+def game_rolls(game_record):
+    """The dice rolled in a recorded game, one per round, for replaying it with dice.ReplayDice."""
+    return [decision.dice for decision in game_record.decisions if decision.active]
+
+
+def decision_moves(game_record):
+    """(seat, move) for every decision of a recorded game, with moves as QwixxGame uses them."""
+    return [(decision.seat, id_to_move(decision.move_id)) for decision in game_record.decisions]
@@ -0,0 +1,265 @@
+import heapq
+import itertools
+from functools import lru_cache
+from score_sheet import COLORS, COLOR_INDEX, INCREASING, LOCKED, _mark_delta
+
+# bound on the number of entries kept in the active player's move table
+MOVE_TABLE_SIZE = 1 << 16
+
+
+def sheet_state(sheet):
+    """Everything about each row that decides which sums can be marked on it."""
+    order, last_number, x_count = sheet.order, sheet.last_number, sheet.x_count
+    return ((order[0] * 14 + last_number[0]) * 2 + (x_count[0] >= 5),
+            (order[1] * 14 + last_number[1]) * 2 + (x_count[1] >= 5),
+            (order[2] * 14 + last_number[2]) * 2 + (x_count[2] >= 5),
+            (order[3] * 14 + last_number[3]) * 2 + (x_count[3] >= 5))
+
+
+def row_state(last_number, order, x_count):
+    """sheet_state() of a single row, for indexing VALID_SUMS."""
+    return (order * 14 + last_number) * 2 + (x_count >= 5)
+
+
+def _can_mark(state, number):
+    state, can_lock = divmod(state, 2)
+    order, last_number = divmod(state, 14)
+    if order == LOCKED:
+        return False
+    # the last number of a row can only be crossed once five numbers are crossed
+    if order == INCREASING:
+        return last_number < number and (number != 12 or can_lock)
+    return last_number > number and (number != 2 or can_lock)
+
+
+# VALID_SUMS[number][state] is 1 when number can be marked on a row in that state
+VALID_SUMS = tuple(tuple(int(_can_mark(state, number)) for state in range(3 * 14 * 2)) for number in range(13))
+
+# INACTIVE_MOVES[white_sum][mask] for every set of rows (bit per row) the white sum can be marked on
+INACTIVE_MOVES = tuple(tuple(tuple((white_sum, color) for row, color in enumerate(COLORS) if mask >> row & 1) + ('Pass',)
+                             for mask in range(16))
+                       for white_sum in range(13))
+
+
+def inactive_moves(rows, white_sum):
+    """Moves for an inactive player, who can only use the sum of the white dice."""
+    valid = VALID_SUMS[white_sum]
+    return INACTIVE_MOVES[white_sum][valid[rows[0]] | valid[rows[1]] << 1 | valid[rows[2]] << 2 | valid[rows[3]] << 3]
+
+
+def inactive_move_ids(rows, white_sum):
+    """inactive_moves() as move ids, in the same order."""
+    valid = VALID_SUMS[white_sum]
+    return INACTIVE_MOVE_IDS[white_sum][valid[rows[0]] | valid[rows[1]] << 1 | valid[rows[2]] << 2 | valid[rows[3]] << 3]
+
+
+def _active_key(rows, dice):
+    # reduce the dice to the marks they allow, so that different rolls share table entries
+    white_1, white_2 = dice[4], dice[5]
+    white_sum = white_1 + white_2
+    valid = VALID_SUMS[white_sum]
+    white_rows = valid[rows[0]] | valid[rows[1]] << 1 | valid[rows[2]] << 2 | valid[rows[3]] << 3
+    colored = []
+    for row in range(4):
+        state = rows[row]
+        if VALID_SUMS[white_1 + dice[row]][state]:
+            colored.append((white_1 + dice[row], row))
+        if VALID_SUMS[white_2 + dice[row]][state]:
+            colored.append((white_2 + dice[row], row))
+    return white_sum, white_rows, tuple(colored)
+
+
+def active_moves(rows, dice):
+    """Moves for the active player, given sheet_state() and the six dice values (colors then whites)."""
+    return _active_moves(*_active_key(rows, dice))
+
+
+def active_move_ids(rows, dice):
+    """active_moves() as move ids, in the same order."""
+    return _active_move_ids(*_active_key(rows, dice))
+
+
+@lru_cache(maxsize=MOVE_TABLE_SIZE)
+def _active_moves(white_sum, white_rows, colored):
+    possible_moves_white = [(white_sum, color) for row, color in enumerate(COLORS) if white_rows >> row & 1]
+    possible_moves_colored = [(number, COLORS[row]) for number, row in colored]
+
+    possible_moves = list(itertools.product(possible_moves_white, possible_moves_colored))
+    possible_moves = possible_moves + possible_moves_white + possible_moves_colored
+
+    #remove duplicates and trivially similar moves (12 in green and 12 in green), for example
+    #dict.fromkeys keeps the first of each, so the order only depends on the dice
+    possible_moves = [move for move in dict.fromkeys(possible_moves) if type(move[0]) == int or move[0] != move[1]]
+    possible_moves.append('Penalty')
+    return tuple(possible_moves)
+
+
+@lru_cache(maxsize=MOVE_TABLE_SIZE)
+def _active_move_ids(white_sum, white_rows, colored):
+    # _active_moves built directly from the ids, in the same order
+    whites = [row * 11 + white_sum - 2 for row in range(4) if white_rows >> row & 1]
+    coloreds = [row * 11 + number - 2 for number, row in colored]
+    pairs = [N_MARKS + white * N_MARKS + colored for white in whites for colored in coloreds if colored != white]
+    move_ids = list(dict.fromkeys(pairs + whites + coloreds))
+    move_ids.append(PENALTY_ID)
+    return tuple(move_ids)
+
+
+# orders iter_moves() can yield moves in
+DISTANCE = 'distance'
+GAIN = 'gain'
+
+
+def iter_moves(sheet, dice, active, order=DISTANCE):
+    """
+    Yield the moves of active_moves() or inactive_moves() best first, without building the list.
+
+    DISTANCE yields the fewest spaces used first, counting 'Pass' as 1 space and 'Penalty' as 13;
+    GAIN yields the largest change in score first. Ties come in move list order, so the first
+    move is the one an agent scanning the whole list for the best value would pick.
+    Moves marking a white and a colored sum are only built once a consumer reads far enough
+    that one of them could come next.
+    """
+    last_number, x_count, row_order = sheet.last_number, sheet.x_count, sheet.order
+    rows = sheet_state(sheet)
+    white_1, white_2 = dice[4], dice[5]
+    white_sum = white_1 + white_2
+    valid = VALID_SUMS[white_sum]
+    whites = [(white_sum, row) for row in range(4) if valid[rows[row]]]
+    coloreds = []
+    if active:
+        for row in range(4):
+            for number in (white_1 + dice[row], white_2 + dice[row]):
+                if VALID_SUMS[number][rows[row]] and (number, row) not in coloreds:
+                    coloreds.append((number, row))
+
+    # keys sort best first
+    if order == DISTANCE:
+        white_keys = [abs(number - last_number[row]) for number, row in whites]
+        colored_keys = [abs(number - last_number[row]) for number, row in coloreds]
+        same_row_key = None
+        last_key = 13 if active else 1
+    else:
+        white_keys = [-_mark_delta(x_count[row], row_order[row], number)[0] for number, row in whites]
+        colored_keys = [-_mark_delta(x_count[row], row_order[row], number)[0] for number, row in coloreds]
+
+        def same_row_key(white, colored):
+            # the colored mark goes on the row as the white mark left it
+            gain, new_x_count, new_order = _mark_delta(x_count[white[1]], row_order[white[1]], white[0])
+            return -gain - _mark_delta(new_x_count, new_order, colored[0])[0]
+        last_key = 5 if active else 0
+
+    # (key, position in the move list, move); pairs come first in the list, then single marks, then 'Penalty' or 'Pass'
+    first_single = len(whites) * len(coloreds)
+    singles = [(white_keys[i], first_single + i, (number, COLORS[row])) for i, (number, row) in enumerate(whites)]
+    singles += [(colored_keys[i], first_single + len(whites) + i, (number, COLORS[row]))
+                for i, (number, row) in enumerate(coloreds) if (number, row) not in whites]
+    singles.append((last_key, N_ACTIONS, 'Penalty' if active else 'Pass'))
+    singles.sort()
+
+    # with DISTANCE a pair uses more spaces than either of its marks alone, so pairs are only
+    # built once a single mark is as far as the closest pair could be
+    pairs = [] if not (whites and coloreds) else None
+    pair_bound = min(white_keys) + min(colored_keys) if order == DISTANCE and pairs is None else float('-inf')
+    for single in singles:
+        if pairs is None and single[0] >= pair_bound:
+            pairs = _pairs(whites, coloreds, white_keys, colored_keys, same_row_key)
+        while pairs and pairs[0][:2] < single[:2]:
+            yield _pair_move(heapq.heappop(pairs), whites, coloreds)
+        yield single[2]
+    if pairs is None:
+        pairs = _pairs(whites, coloreds, white_keys, colored_keys, same_row_key)
+    while pairs:
+        yield _pair_move(heapq.heappop(pairs), whites, coloreds)
+
+
+def _pairs(whites, coloreds, white_keys, colored_keys, same_row_key):
+    """Heap of the moves marking a white then a colored sum, as (key, position in the move list, white, colored)."""
+    pairs = []
+    for i, white in enumerate(whites):
+        for j, colored in enumerate(coloreds):
+            if colored == white:
+                continue
+            if colored[1] != white[1] or same_row_key is None:
+                pair_key = white_keys[i] + colored_keys[j]
+            else:
+                pair_key = same_row_key(white, colored)
+            pairs.append((pair_key, i * len(coloreds) + j, i, j))
+    heapq.heapify(pairs)
+    return pairs
+
+
+def _pair_move(pair, whites, coloreds):
+    white, colored = whites[pair[2]], coloreds[pair[3]]
+    return (white[0], COLORS[white[1]]), (colored[0], COLORS[colored[1]])
+
+
+# Canonical action ids: every move gets a dense id in range(N_ACTIONS), and is decoded by id_to_move().
+#   0-43       single mark, row * 11 + (number - 2)
+#   44-1979    white mark then colored mark, 44 + first * 44 + second
+#   1980-1982  'Penalty', 'Pass', 'Q'
+N_MARKS = 44
+PENALTY_ID = N_MARKS + N_MARKS * N_MARKS
+PASS_ID = PENALTY_ID + 1
+QUIT_ID = PENALTY_ID + 2
+N_ACTIONS = QUIT_ID + 1
+SPECIAL_IDS = {'Penalty': PENALTY_ID, 'Pass': PASS_ID, 'Q': QUIT_ID}
+
+
+def move_id(move):
+    return MOVE_IDS[move]
+
+
+def _move_id(move):
+    if type(move) == str:
+        return SPECIAL_IDS[move]
+    if type(move[0]) == int:
+        return COLOR_INDEX[move[1]] * 11 + move[0] - 2
+    (number_1, color_1), (number_2, color_2) = move
+    return N_MARKS + (COLOR_INDEX[color_1] * 11 + number_1 - 2) * N_MARKS + COLOR_INDEX[color_2] * 11 + number_2 - 2
+
+
+def _decode(action_id):
+    if action_id >= PENALTY_ID:
+        return ('Penalty', 'Pass', 'Q')[action_id - PENALTY_ID]
+    if action_id < N_MARKS:
+        row, number = divmod(action_id, 11)
+        return (number + 2, COLORS[row])
+    first, second = divmod(action_id - N_MARKS, N_MARKS)
+    return _decode(first), _decode(second)
+
+
+def _marks(action_id):
+    if action_id >= PENALTY_ID:
+        return ()
+    if action_id < N_MARKS:
+        return (divmod(action_id, 11)[0], action_id % 11 + 2),
+    first, second = divmod(action_id - N_MARKS, N_MARKS)
+    return _marks(first) + _marks(second)
+
+
+# every id decoded once: the move as QwixxGame uses it, and its marks as (row, number) pairs in the order they are made
+MOVES = tuple(_decode(action_id) for action_id in range(N_ACTIONS))
+MOVE_MARKS = tuple(_marks(action_id) for action_id in range(N_ACTIONS))
+# move_id() of every move as a table lookup, since agents look up the ids of the moves they are offered
+MOVE_IDS = {move: _move_id(move) for move in MOVES}
+
+# INACTIVE_MOVES as move ids
+INACTIVE_MOVE_IDS = tuple(tuple(tuple(_move_id(move) for move in moves) for moves in by_mask) for by_mask in INACTIVE_MOVES)
+
+
+def id_to_move(action_id):
+    return MOVES[action_id]
+
+
+def move_marks(move):
+    """
+    The (row, number) pairs a move marks, in order. Also works for moves without an id, such as
+    the sums of dice that have not been rolled yet, which QLearnPlayer.q_learn can be offered.
+    """
+    action_id = MOVE_IDS.get(move)
+    if action_id is not None:
+        return MOVE_MARKS[action_id]
+    if type(move) == str:
+        return ()
+    return tuple((COLOR_INDEX[color], number) for number, color in ([move] if type(move[0]) == int else move))
@@ -0,0 +1,75 @@
+import itertools
+from moves import row_state, VALID_SUMS
+
+# Exact odds for a single row, from enumerating every roll of the dice that matter to it:
+# the two white dice, and for the active player the row's colored die as well.
+# Rows are given as the row states of moves.sheet_state(); distances are |number - last_number|.
+N_ROW_STATES = 3 * 14 * 2
+MAX_DISTANCE = 12
+
+# WHITE_SUM_PROBABILITY[number] is the chance the white dice add up to number
+WHITE_SUM_PROBABILITY = tuple(sum(1 for white_1, white_2 in itertools.product(range(1, 7), repeat=2)
+                                  if white_1 + white_2 == number) / 36 for number in range(13))
+
+
+def _row_options(state, white_1, white_2, colored):
+    """Numbers that can be marked on a row for one roll: the white sum, then the colored sums."""
+    numbers = [white_1 + white_2]
+    if colored is not None:
+        numbers += [white_1 + colored, white_2 + colored]
+    return [number for number in numbers if VALID_SUMS[number][state]]
+
+
+def _crosses(state, white_1, white_2, colored):
+    """Most crosses a roll lets the player add to a row, counting the two for locking it."""
+    order = state // 28
+    lock_number = 12 if order == 0 else 2
+    white_sum = white_1 + white_2
+    best = 0
+    for number in _row_options(state, white_1, white_2, colored):
+        best = max(best, 2 if number == lock_number else 1)
+    if colored is not None and VALID_SUMS[white_sum][state]:
+        # white sum then a colored sum in the same row, as get_possible_moves allows
+        for number in (white_1 + colored, white_2 + colored):
+            if number != white_sum and VALID_SUMS[number][state]:
+                best = max(best, 1 + (white_sum == lock_number) + (number == lock_number))
+    return best
+
+
+def _tables(active):
+    rolls = list(itertools.product(range(1, 7), repeat=3 if active else 2))
+    advance = []
+    expected = []
+    for state in range(N_ROW_STATES):
+        last_number = (state // 2) % 14
+        counts = [0] * (MAX_DISTANCE + 1)
+        crosses = 0
+        for roll in rolls:
+            colored = roll[2] if active else None
+            options = _row_options(state, roll[0], roll[1], colored)
+            if options:
+                counts[min(abs(number - last_number) for number in options)] += 1
+            crosses += _crosses(state, roll[0], roll[1], colored)
+        # cumulative: chance the nearest legal number is at most k spaces away
+        advance.append(tuple(itertools.accumulate(count / len(rolls) for count in counts)))
+        expected.append(crosses / len(rolls))
+    return tuple(advance), tuple(expected)
+
+
+# ADVANCE_PROBABILITY[active][state][k]: chance the next roll allows a mark at most k spaces past the last number
+# EXPECTED_CROSSES[active][state]: expected number of crosses the next roll allows on the row
+_INACTIVE, _ACTIVE = _tables(False), _tables(True)
+ADVANCE_PROBABILITY = (_INACTIVE[0], _ACTIVE[0])
+EXPECTED_CROSSES = (_INACTIVE[1], _ACTIVE[1])
+
+
+def advance_probability(sheet, row, distance, active=False):
+    """Chance the next roll allows a mark on row at most distance spaces past its last number."""
+    if distance < 0:
+        return 0.0
+    state = row_state(sheet.last_number[row], sheet.order[row], sheet.x_count[row])
+    return ADVANCE_PROBABILITY[active][state][min(distance, MAX_DISTANCE)]
+
+
+def expected_crosses(sheet, row, active=False):
+    return EXPECTED_CROSSES[active][row_state(sheet.last_number[row], sheet.order[row], sheet.x_count[row])]
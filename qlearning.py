@@ -0,0 +1,370 @@
+import bisect
+import mmap
+import os
+import pickle
+import random
+import struct
+import sys
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from agents import QLearnPlayer, state_to_partition
+from dice import DiceStream
+from moves import move_id
+from qwixx import QwixxGame
+
+
+# Binary table layout written by QTable.save_mapped() and read by MappedQTable:
+#   header   MAPPED_MAGIC, then version, partition count, entry count (little-endian uint32 each)
+#   keys     one KEY_BYTES big-endian pack_partition() key per partition, sorted ascending
+#   starts   partition count + 1 native uint32 offsets, the entries of partition i being starts[i]:starts[i + 1]
+#   actions  native uint16 moves.move_id of every entry, ascending within each partition
+#   values   native float32 Q-value of every entry, 4-byte aligned
+MAPPED_MAGIC = b'QWXQ'
+MAPPED_VERSION = 2
+HEADER = struct.Struct('<4sIII')
+KEY_BYTES = 24
+X_BITS = 5
+# partitions whose row a MappedQTable remembers, most recently used first out of the bound
+ROW_CACHE_SIZE = 1 << 12
+
+
+def pack_partition(partition):
+    """state_to_partition() result as an int: player count, level, then x_count // 3 per row."""
+    level, x_counts = partition
+    key = len(x_counts) | level << 4
+    shift = 12
+    for player_x_counts in x_counts:
+        for x_count in player_x_counts:
+            key |= x_count << shift
+            shift += X_BITS
+    return key
+
+
+class _QValues:
+    """
+    Lookups shared by QTable and MappedQTable: find() gives a partition's row, or None,
+    and value() the Q-value of an action in a row, read from its sorted action ids.
+    """
+    def get(self, partition, action_id):
+        row = self.find(partition)
+        return self.value(row, action_id) if row is not None else 0.0
+
+    def best(self, partition, action_ids):
+        """Index into action_ids of the action with the highest Q-value (the first one on ties)."""
+        row = self.find(partition)
+        if row is None:
+            return 0
+        values = [self.value(row, action_id) for action_id in action_ids]
+        return max(range(len(action_ids)), key=values.__getitem__)
+
+    def max_value(self, partition, action_ids):
+        row = self.find(partition)
+        if row is None:
+            return 0.0
+        return max(self.value(row, action_id) for action_id in action_ids)
+
+
+class QTable(_QValues):
+    """
+    Q-values of the actions taken in each partition (see state_to_partition), keyed by the
+    canonical action id of moves.move_id; an action never taken there is worth 0.
+
+    Only a few of the N_ACTIONS actions are ever legal in one partition, so each row keeps
+    the ids it has seen sorted, with their values and visit counts in parallel arrays.
+    """
+    def __init__(self):
+        self.index = {}
+        self.partitions = []
+        self.actions = []
+        self.values = []
+        # number of updates made to each entry, used to weight merges and decay the learning rate
+        self.visits = []
+
+    def __len__(self):
+        return len(self.partitions)
+
+    def entries(self):
+        return sum(len(actions) for actions in self.actions)
+
+    def row(self, partition):
+        """Index of a partition's row, adding an empty row for a new partition."""
+        row = self.index.get(partition)
+        if row is None:
+            row = self.index[partition] = len(self.partitions)
+            self.partitions.append(partition)
+            self.actions.append(array('H'))
+            self.values.append(array('f'))
+            self.visits.append(array('I'))
+        return row
+
+    def entry(self, row, action_id):
+        """Position of action_id in a row, adding it with no value and no visits if the row lacks it."""
+        actions = self.actions[row]
+        position = bisect.bisect_left(actions, action_id)
+        if position == len(actions) or actions[position] != action_id:
+            actions.insert(position, action_id)
+            self.values[row].insert(position, 0.0)
+            self.visits[row].insert(position, 0)
+        return position
+
+    def find(self, partition):
+        return self.index.get(partition)
+
+    def value(self, row, action_id):
+        actions = self.actions[row]
+        position = bisect.bisect_left(actions, action_id)
+        if position == len(actions) or actions[position] != action_id:
+            return 0.0
+        return self.values[row][position]
+
+    def copy(self):
+        table = QTable()
+        table.index = dict(self.index)
+        table.partitions = list(self.partitions)
+        table.actions = [array('H', actions) for actions in self.actions]
+        table.values = [array('f', values) for values in self.values]
+        table.visits = [array('I', visits) for visits in self.visits]
+        return table
+
+    def merge(self, other, base=None):
+        """
+        Fold another table into this one, averaging each entry weighted by its visits.
+
+        When other was trained starting from base, only the visits it made since then count.
+        """
+        for partition, other_row in other.index.items():
+            row = self.row(partition)
+            base_row = base.index.get(partition) if base is not None else None
+            base_visits = dict(zip(base.actions[base_row], base.visits[base_row])) if base_row is not None else {}
+            for action_id, value, other_visits in zip(other.actions[other_row], other.values[other_row],
+                                                      other.visits[other_row]):
+                other_visits -= base_visits.get(action_id, 0)
+                if other_visits:
+                    position = self.entry(row, action_id)
+                    visits = self.visits[row][position]
+                    total = visits + other_visits
+                    self.values[row][position] = (self.values[row][position] * visits + value * other_visits) / total
+                    self.visits[row][position] = total
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump((self.partitions, self.actions, self.values, self.visits), file)
+
+    def save_mapped(self, path):
+        """Write the Q-values in the fixed binary layout that MappedQTable maps read-only."""
+        keys = sorted((pack_partition(partition), row) for row, partition in enumerate(self.partitions))
+        starts = array('I', [0])
+        actions = array('H')
+        values = array('f')
+        for _, row in keys:
+            actions.extend(self.actions[row])
+            values.extend(self.values[row])
+            starts.append(len(actions))
+        with open(path, 'wb') as file:
+            file.write(HEADER.pack(MAPPED_MAGIC, MAPPED_VERSION, len(keys), len(actions)))
+            for key, _ in keys:
+                file.write(key.to_bytes(KEY_BYTES, 'big'))
+            file.write(starts.tobytes())
+            file.write(actions.tobytes())
+            file.write(bytes(-file.tell() % 4))
+            file.write(values.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as file:
+            partitions, actions, values, visits = pickle.load(file)
+        table = cls()
+        table.partitions = partitions
+        table.index = {partition: row for row, partition in enumerate(partitions)}
+        table.actions = actions
+        table.values = values
+        table.visits = visits
+        return table
+
+
+class _MappedKeys:
+    """Sorted partition keys of a mapped table, as a sequence bisect can search."""
+    def __init__(self, buffer, count):
+        self.buffer = buffer
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return int.from_bytes(self.buffer[index * KEY_BYTES:(index + 1) * KEY_BYTES], 'big')
+
+
+class MappedQTable(_QValues):
+    """
+    Read-only QTable backed by a file written with QTable.save_mapped().
+
+    The file is memory-mapped, so processes that open the same table share one copy of
+    it through the page cache, and opening it does not read the values. Values are read
+    from the map on every lookup; only the rows of recent partitions are remembered.
+    Pickling a MappedQTable only sends its path, so workers map the file themselves.
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, entries = HEADER.unpack_from(self.map)
+        if magic != MAPPED_MAGIC or version != MAPPED_VERSION:
+            raise ValueError(f"{path} is not a version {MAPPED_VERSION} mapped Q-table")
+        self.count = count
+        view = memoryview(self.map)
+        start = HEADER.size
+        self.keys = _MappedKeys(view[start:start + count * KEY_BYTES], count)
+        start += count * KEY_BYTES
+        self.starts = view[start:start + 4 * (count + 1)].cast('I')
+        start += 4 * (count + 1)
+        self.actions = view[start:start + 2 * entries].cast('H')
+        start += 2 * entries
+        start += -start % 4
+        self.values = view[start:start + 4 * entries].cast('f')
+        # row of the partitions looked up lately, None for those the table lacks
+        self.rows = OrderedDict()
+
+    def __reduce__(self):
+        return MappedQTable, (self.path,)
+
+    def __len__(self):
+        return self.count
+
+    def find(self, partition):
+        rows = self.rows
+        if partition in rows:
+            rows.move_to_end(partition)
+            return rows[partition]
+        key = pack_partition(partition)
+        row = bisect.bisect_left(self.keys, key)
+        if row == self.count or self.keys[row] != key:
+            row = None
+        rows[partition] = row
+        if len(rows) > ROW_CACHE_SIZE:
+            rows.popitem(last=False)
+        return row
+
+    def value(self, row, action_id):
+        start, end = self.starts[row], self.starts[row + 1]
+        position = bisect.bisect_left(self.actions, action_id, start, end)
+        if position == end or self.actions[position] != action_id:
+            return 0.0
+        return self.values[position]
+
+
+def load_table(path):
+    """Open a table saved by either QTable.save() or QTable.save_mapped()."""
+    with open(path, 'rb') as file:
+        mapped = file.read(len(MAPPED_MAGIC)) == MAPPED_MAGIC
+    return MappedQTable(path) if mapped else QTable.load(path)
+
+
+class TrainingPlayer(QLearnPlayer):
+    """QLearnPlayer that picks moves epsilon-greedily and updates its table after every decision."""
+    def __init__(self, game, q_table, gamma=0.99, epsilon=0.1, alpha_initial=0.3, alpha_decay=0.995):
+        super().__init__(game, q_table)
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.alpha_initial = alpha_initial
+        self.alpha_decay = alpha_decay
+        self.previous = None
+
+    def update(self, target):
+        row, action_id = self.previous
+        table = self.q_table
+        position = table.entry(row, action_id)
+        values, visits = table.values[row], table.visits[row]
+        alpha = self.alpha_initial * self.alpha_decay ** visits[position]
+        values[position] += alpha * (target - values[position])
+        visits[position] += 1
+
+    def choose_move(self, possible_moves, state):
+        partition = state_to_partition(state)
+        action_ids = [move_id(move) for move in possible_moves]
+        if self.previous is not None:
+            self.update(self.gamma * self.q_table.max_value(partition, action_ids))
+
+        if random.random() < self.epsilon:
+            # Exploration: choose a random valid action
+            choice = random.randrange(len(possible_moves))
+        else:
+            # Exploitation: choose the action with the highest Q-value
+            choice = self.q_table.best(partition, action_ids)
+        self.previous = (self.q_table.row(partition), action_ids[choice])
+        return choice
+
+    def end_episode(self, won):
+        if self.previous is not None:
+            self.update(200 if won else -200)
+        self.previous = None
+
+
+def train_worker(player_types, episodes, dice_source, q_table=None, **parameters):
+    """Play `episodes` games with the q_learn seat learning, and return the updated table."""
+    random.seed(dice_source.seed)
+    q_table = q_table if q_table is not None else QTable()
+    game = QwixxGame(*player_types, dice_source=dice_source)
+    seat = [player_type.lower() for player_type in player_types].index("q_learn")
+    learner = TrainingPlayer(game, q_table, **parameters)
+    # refresh() resets the players in place, so the learner keeps its seat for every episode
+    game.players[seat] = learner
+    for _ in range(episodes):
+        scores = game.play()
+        learner.end_episode(scores.index(max(scores)) == seat)
+    return q_table
+
+
+def train(player_types, episodes, rounds=1, workers=None, seed=0, q_table=None, **parameters):
+    """
+    Train a QTable for the q_learn seat of player_types.
+
+    Each round splits `episodes` across worker processes, every worker starting from the
+    current table, and merges what they learned back into it.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    q_table = q_table if q_table is not None else QTable()
+    dice_source = DiceStream(seed)
+    for round_index in range(rounds):
+        shares = [episodes // workers + (worker < episodes % workers) for worker in range(workers)]
+        sources = [dice_source.spawn(round_index * workers + worker) for worker in range(workers)]
+        if workers == 1:
+            # learns in place
+            train_worker(player_types, shares[0], sources[0], q_table, **parameters)
+            continue
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(train_worker, player_types, share, source, q_table, **parameters)
+                       for share, source in zip(shares, sources) if share]
+            results = [future.result() for future in futures]
+        merged = q_table.copy()
+        for result in results:
+            merged.merge(result, base=q_table)
+        q_table = merged
+    return q_table
+
+
+if __name__ == "__main__":
+    # usage: python qlearning.py EPISODES OUTPUT [--rounds N] [--workers N] [--mapped] [opponents...]
+    # --mapped saves the table in the binary layout that MappedQTable memory-maps
+    args = sys.argv[1:]
+    options = {"--rounds": 1, "--workers": None}
+    for option in options:
+        if option in args:
+            position = args.index(option)
+            options[option] = int(args[position + 1])
+            del args[position:position + 2]
+    mapped = "--mapped" in args
+    if mapped:
+        args.remove("--mapped")
+    episodes, output = int(args[0]), args[1]
+    player_types = ["q_learn"] + (args[2:] or ["greedy"])
+
+    q_table = train(player_types, episodes, rounds=options["--rounds"], workers=options["--workers"])
+    if mapped:
+        q_table.save_mapped(output)
+    else:
+        q_table.save(output)
+    print(f"Trained on {episodes * options['--rounds']} games, {len(q_table)} partitions saved to {output}")
@@ -1,25 +1,138 @@
 import random
-import itertools
-from dice import Dice
-from agents import HumanPlayer, GreedyPlayer, HeuristicGreedyPlayer, HeuristicSpacePlayer, QLearnPlayer
+import time
+from dice import Dice, DiceStream
+from score_sheet import LOCKED, packed_row, packed_penalties
+from moves import sheet_state, active_moves, inactive_moves, active_move_ids, inactive_move_ids, iter_moves, QUIT_ID
+from agents import HumanPlayer, GreedyPlayer, HeuristicGreedyPlayer, HeuristicSpacePlayer, LookaheadPlayer, QLearnPlayer, TablePlayer, SKIP_ODDS
+
+class GameObserver:
+    """Receives the events of a game as it is played. Subclass and override the events you need."""
+    def game_started(self, game):
+        pass
+
+    def round_started(self, game):
+        pass
+
+    def turn_started(self, game, player):
+        pass
+
+    def move_chosen(self, game, player, move):
+        pass
+
+    def game_over(self, game, reason):
+        pass
+
+    def game_ended(self, game, scores):
+        pass
+
+
+class ConsoleObserver(GameObserver):
+    """Prints the game as it is played; the default observer when a human is playing."""
+    def game_started(self, game):
+        print("Welcome to Qwixx!")
+
+    def round_started(self, game):
+        game.print_score_sheets()
+
+    def turn_started(self, game, player):
+        print(f"{player.name}'s turn:")
+        print("Rolling dice...")
+
+        # Print dice color and score
+        print("Dice:")
+        for die in game.dice:
+            print(f"  {die.color}: {die.value}")
+
+    def move_chosen(self, game, player, move):
+        print(f"{player.name} chose:", move)
+
+    def game_over(self, game, reason):
+        print(reason)
+
+    def game_ended(self, game, scores):
+        print("Game Over!")
+        game.print_score_sheets()
+        for player, score in zip(game.players, scores):
+            print(f"player {player} score == {score}")
+
+
+# phases of a round timed by PhaseTimings, in the order they happen
+PHASES = ("dice", "moves", "decision", "update", "lock", "end_check")
+
+
+class PhaseTimings:
+    """Call counts and cumulative seconds spent in each phase of the rounds played with profiling on."""
+    def __init__(self):
+        self.counts = [0] * len(PHASES)
+        self.seconds = [0.0] * len(PHASES)
+        self.games = 0
+
+    def merge(self, other):
+        self.games += other.games
+        for phase in range(len(PHASES)):
+            self.counts[phase] += other.counts[phase]
+            self.seconds[phase] += other.seconds[phase]
+
+    def summary(self):
+        """Per-phase calls, total seconds, mean microseconds per call and share of the timed total."""
+        total = sum(self.seconds) or 1.0
+        return {name: {"calls": calls, "seconds": seconds, "mean_us": 1e6 * seconds / calls if calls else 0.0,
+                       "share": seconds / total}
+                for name, calls, seconds in zip(PHASES, self.counts, self.seconds)}
+
+    def format(self):
+        lines = [f"{'phase':10} {'calls':>10} {'seconds':>10} {'us/call':>9} {'share':>7}"]
+        for name, phase in self.summary().items():
+            lines.append(f"{name:10} {phase['calls']:10} {phase['seconds']:10.3f} {phase['mean_us']:9.2f} "
+                         f"{phase['share']:7.1%}")
+        return "\n".join(lines)
+
 
 class QwixxGame:
-    def __init__(self, *player_types):
+    def __init__(self, *player_types, dice_source=None, observer=None, q_table=None, profile=False,
+                 decision_cache=None):
+        # rolls come from dice_source, anything with a roll() returning six values (see dice.py)
+        self.dice_source = dice_source if dice_source is not None else DiceStream()
+        # pre-trained policy for q_learn players (see qlearning.py), which otherwise learn on their first move
+        self.q_table = q_table
+        # decisions.DecisionCache the deterministic players look their moves up in
+        self.decision_cache = decision_cache
         self.players = self.initialize_players(*player_types)
         self.active_player_index = 0
         self.dice = [Dice('Red'), Dice('Yellow'), Dice('Green'), Dice('Blue'), Dice('White'), Dice('White')]
+        self.dice_values = (0, 0, 0, 0, 0, 0)
         self.game_over = False
-        if any(player_type.lower() == "human" for player_type in player_types):
-            self.print_info = True
-        else:
-            self.print_info = False
+        self.reset_counters()
+        # without an observer the game runs headless, on the fast path in play()
+        if observer is None and any(player_type.lower() == "human" for player_type in player_types):
+            observer = ConsoleObserver()
+        self.observer = observer
         self.player_types = player_types
+        # per-phase timings of headless games, summed over every game played, when profiling
+        self.timings = PhaseTimings() if profile else None
     
     def refresh(self):
-        self.players = self.initialize_players(*self.player_types)
+        # the same players and dice play the next game, reset in place
+        for player in self.players:
+            player.reset()
         self.active_player_index = 0
-        self.dice = [Dice('Red'), Dice('Yellow'), Dice('Green'), Dice('Blue'), Dice('White'), Dice('White')]
+        for die in self.dice:
+            die.value = 0
+        self.dice_values = (0, 0, 0, 0, 0, 0)
         self.game_over = False
+        self.reset_counters()
+
+    def reset_counters(self):
+        # running totals over all sheets, kept up to date by sheet_changed()
+        self.locked_mask = 0
+        self.propagated_mask = 0
+        self.max_penalties = 0
+
+    def sheet_changed(self, player):
+        sheet = player.score_sheet
+        self.locked_mask |= sheet.locked_mask
+        if sheet.penalties > self.max_penalties:
+            self.max_penalties = sheet.penalties
 
     def initialize_players(self, *player_types):
         players = []
@@ -30,16 +143,24 @@ class QwixxGame:
                 players.append(GreedyPlayer())
             elif player_type.lower() == "heuristic_greedy":
                 players.append(HeuristicGreedyPlayer())
+            elif player_type.lower() == "heuristic_greedy_odds":
+                players.append(HeuristicGreedyPlayer(skip_odds=SKIP_ODDS))
             elif player_type.lower() == "heuristic_space":
                 players.append(HeuristicSpacePlayer())
+            elif player_type.lower() == "lookahead":
+                players.append(LookaheadPlayer())
+            elif player_type.lower() == "table":
+                players.append(TablePlayer())
             elif player_type.lower() == "q_learn":
-                players.append(QLearnPlayer(self))
+                players.append(QLearnPlayer(self, self.q_table))
+        if self.decision_cache is not None:
+            players = [self.decision_cache.wrap(player) for player in players]
         return players
 
     def print_score_sheets(self):
         print("Current Score Sheets:")
         for player in self.players:
-            print(f"{player.__class__.__name__}:")
+            print(f"{player.name}:")
             for color, values in player.score_sheet.items():
                 if color != 'Penalties':
                     last_number = values['last_number']
@@ -54,8 +175,9 @@ class QwixxGame:
             print()
 
     def roll_dice(self):
-        for die in self.dice:
-            die.roll()
+        self.dice_values = self.dice_source.roll()
+        for die, value in zip(self.dice, self.dice_values):
+            die.value = value
 
 
     def check_valid_move(self, phase, row, dice1, dice2):
@@ -108,15 +230,8 @@ class QwixxGame:
     def play_round(self):
         player = self.players[self.active_player_index]
         self.roll_dice()
-        if self.print_info:
-            print(f"{player.__class__.__name__}'s turn:")
-            print("Rolling dice...")
-        
-            # Print dice color and score
-            if self.print_info:
-                print("Dice:")
-                for die in self.dice:
-                    print(f"  {die.color}: {die.value}")
+        if self.observer is not None:
+            self.observer.turn_started(self, player)
 
         active_player = self.players[self.active_player_index]
 
@@ -144,23 +259,16 @@ class QwixxGame:
 
     def take_action(self,player,action):
         self.roll_dice()
-        if self.print_info:
-            print(f"{player.__class__.__name__}'s turn:")
-            print("Rolling dice...")
-        
-            # Print dice color and score
-            if self.print_info:
-                print("Dice:")
-                for die in self.dice:
-                    print(f"  {die.color}: {die.value}")
+        if self.observer is not None:
+            self.observer.turn_started(self, player)
 
         active_player = self.players[self.active_player_index]
 
         # Active Player
-        #print("Active player:")
-        #print(player.__class__.__name__, ' =?= ', active_player.__class__.__name__)
-        if player.__class__.__name__ == active_player.__class__.__name__:
+        # the learner may not be one of self.players (a caller may play it in another's place), so seats are matched by type
+        if type(player) is type(active_player):
             player.update_score_sheet(action)
+            self.sheet_changed(active_player)
         else:
             self.move(active_player)
         if self.game_over == True:
@@ -169,10 +277,9 @@ class QwixxGame:
         # inactive players
         for other_player in self.players:
             if other_player != active_player:
-                #print("Inactive player player:")
-                #print(player.__class__.__name__, ' =?= ', other_player.__class__.__name__)
-                if player.__class__.__name__ == other_player.__class__.__name__:
+                if type(player) is type(other_player):
                     player.update_score_sheet(action)
+                    self.sheet_changed(other_player)
                 else:
                     self.move(other_player)
                 if self.game_over == True:
@@ -189,155 +296,228 @@ class QwixxGame:
             self.game_over = True
 
         #return new state
-        return self.get_state_representation()
+        return self.get_state_key()
 
     def get_possible_moves(self, player):
+        # legal moves only depend on the row states and the dice, so they are looked up in a memoized table
+        rows = sheet_state(player.score_sheet)
+        dice = self.dice
         if self.players[self.active_player_index] == player:
-            white_dice_1 = next(die for die in self.dice if die.color == 'White')
-            white_dice_2 = next(die for die in self.dice if die.color == 'White' and die != white_dice_1)
-
-            # Generate possible moves
-            possible_moves_white = []
-            possible_moves_colored = []
-
-            # Iterate through each color
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                if self.check_valid_move(1, player.score_sheet[color], white_dice_1, white_dice_2):
-                    possible_moves_white.append((white_dice_1.value + white_dice_2.value, color))
-
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                for white_die in [white_dice_1, white_dice_2]:
-                    for colored_die in [die for die in self.dice if die.color == color]:
-                        if self.check_valid_move(2, player.score_sheet[color], white_die, colored_die):
-                            possible_moves_colored.append((white_die.value + colored_die.value, color))
-
-            possible_moves = list(itertools.product(possible_moves_white, possible_moves_colored))
-            possible_moves = possible_moves + possible_moves_white + possible_moves_colored
-
-            #remove duplicates
-            nondup_possible_moves = list(set(possible_moves))
-            possible_moves = []
-
-            #remove trivially similar moves (12 in green and 12 in green), for example
-            for move in nondup_possible_moves:
-                if type(move[0]) == int:
-                    possible_moves.append(move)
-                else:
-                    if move[0] != move[1]:
-                        possible_moves.append(move)
-                
-            possible_moves.append('Penalty')
-            if isinstance(player, HumanPlayer):
-                possible_moves.append('Q')
-            
-            return possible_moves
+            values = (dice[0].value, dice[1].value, dice[2].value, dice[3].value, dice[4].value, dice[5].value)
+            possible_moves = list(active_moves(rows, values))
         else:
-            white_dice_1 = next(die for die in self.dice if die.color == 'White')
-            white_dice_2 = next(die for die in self.dice if die.color == 'White' and die != white_dice_1)
+            possible_moves = list(inactive_moves(rows, dice[4].value + dice[5].value))
 
-            # Generate possible moves
-            possible_moves = []
+        if isinstance(player, HumanPlayer):
+            possible_moves.append('Q')
+
+        return possible_moves
+
+    def get_possible_move_ids(self, player):
+        """get_possible_moves() as moves.move_id ids, in the same order; decode them with moves.id_to_move."""
+        rows = sheet_state(player.score_sheet)
+        dice = self.dice
+        if self.players[self.active_player_index] == player:
+            values = (dice[0].value, dice[1].value, dice[2].value, dice[3].value, dice[4].value, dice[5].value)
+            move_ids = active_move_ids(rows, values)
+        else:
+            move_ids = inactive_move_ids(rows, dice[4].value + dice[5].value)
 
-            # Iterate through each color
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                if self.check_valid_move(1, player.score_sheet[color], white_dice_1, white_dice_2):
-                    possible_moves.append((white_dice_1.value + white_dice_2.value, color))
+        if isinstance(player, HumanPlayer):
+            move_ids += (QUIT_ID,)
 
-            possible_moves.append('Pass')
-            if isinstance(player, HumanPlayer):
-                possible_moves.append('Q')
+        return move_ids
 
-            return possible_moves
+    def iter_moves(self, player, order):
+        """Lazy get_possible_moves(), best first in a moves.iter_moves order."""
+        active = self.players[self.active_player_index] == player
+        return iter_moves(player.score_sheet, self.dice_values, active, order)
 
     def check_end_conditions(self, state=None):
         if state == None:
             # Check if any player has 4 penalties
-            for player in self.players:
-                if player.score_sheet['Penalties'] >= 4:
-                    if self.print_info:
-                        print(f"{player.__class__.__name__} has 4 penalties. Game over!")
-                    return True
+            if self.max_penalties >= 4:
+                if self.observer is not None:
+                    player = next(player for player in self.players if player.score_sheet.penalties >= 4)
+                    self.observer.game_over(self, f"{player.name} has 4 penalties. Game over!")
+                return True
 
             # Check if two rows are locked
-            locked_rows = 0
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                if self.players[0].score_sheet[color]['order'] == 'locked':
-                    locked_rows += 1
+            locked_rows = bin(self.locked_mask).count('1')
             if locked_rows >= 2:
-                if self.print_info:
-                    print("Two rows are locked. Game over!")
+                if self.observer is not None:
+                    self.observer.game_over(self, "Two rows are locked. Game over!")
                 return True
 
             return False
         else:
-            for score_sheet in state['player_scores']:
-                if score_sheet['Penalties'] >= 4:
-                    if self.print_info:
-                        print(f"{player.__class__.__name__} has 4 penalties. Game over!")
+            sheets = state[2]
+            for sheet in sheets:
+                if packed_penalties(sheet) >= 4:
+                    if self.observer is not None:
+                        self.observer.game_over(self, "A player has 4 penalties. Game over!")
                     return True
                 
             locked_rows = 0
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                if state['player_scores'][0][color]['order'] == 'locked':
+            for row in range(4):
+                if packed_row(sheets[0], row)[1] == LOCKED:
                     locked_rows += 1
             if locked_rows >= 2:
-                if self.print_info:
-                    print("Two rows are locked. Game over!")
+                if self.observer is not None:
+                    self.observer.game_over(self, "Two rows are locked. Game over!")
                 return True
 
             return False
     
     def lock(self):
-        to_lock = []
-        for player in self.players:
-            for color in ['Red', 'Yellow', 'Green', 'Blue']:
-                if player.score_sheet[color]['order'] == 'locked':
-                    to_lock.append(color)
-        for player in self.players:
-            for color in to_lock:
-                player.score_sheet[color]['order'] = 'locked'
+        # only touch the sheets when a row was locked since the last call
+        if self.locked_mask != self.propagated_mask:
+            for player in self.players:
+                player.score_sheet.lock_rows(self.locked_mask)
+            self.propagated_mask = self.locked_mask
     
     def move(self,player):
-        possible_moves = self.get_possible_moves(player)
-
         # Prompt the choice method of each player
-        if player.__class__.__name__ == "QLearnPlayer":
-            state = self.get_state_representation()
-            move_choice = player.choose_move(possible_moves, state)
+        if player.move_order is not None:
+            # agents that only want the best move read the moves lazily, best first
+            chosen_move = player.choose_from(self.iter_moves(player, player.move_order))
         else:
-            move_choice = player.choose_move(possible_moves)        
+            possible_moves = self.get_possible_moves(player)
+            if player.needs_state:
+                state = self.get_state_key()
+                chosen_move = possible_moves[player.choose_move(possible_moves, state)]
+            else:
+                chosen_move = possible_moves[player.choose_move(possible_moves)]
 
-        chosen_move = possible_moves[move_choice]
-        if self.print_info:
-            print(f"{player.__class__.__name__} chose:", chosen_move)     
+        if self.observer is not None:
+            self.observer.move_chosen(self, player, chosen_move)
 
         if chosen_move == 'Q':
             self.game_over = True
             return
         else:
             player.update_score_sheet(chosen_move)
+            self.sheet_changed(player)
         return
         
-    def play(self):
-        if self.print_info:
-            print("Welcome to Qwixx!")
+    def play_round_headless(self, deciders):
+        """play_round without observer calls, for deciders built by play()."""
+        self.roll_dice()
+        active_index = self.active_player_index
+
+        # Active Player first, then the inactive players in seat order
+        for index in [active_index] + [i for i in range(len(deciders)) if i != active_index]:
+            player, choose_move, needs_state, move_order = deciders[index]
+            if move_order is not None:
+                chosen_move = choose_move(iter_moves(player.score_sheet, self.dice_values, index == active_index,
+                                                     move_order))
+                player.update_score_sheet(chosen_move)
+                self.sheet_changed(player)
+                continue
+            possible_moves = self.get_possible_moves(player)
+            if needs_state:
+                chosen_move = possible_moves[choose_move(possible_moves, self.get_state_key())]
+            else:
+                chosen_move = possible_moves[choose_move(possible_moves)]
+            if chosen_move == 'Q':
+                self.game_over = True
+                return
+            player.update_score_sheet(chosen_move)
+            self.sheet_changed(player)
 
-        while not self.game_over:
-            if self.print_info:
-                self.print_score_sheets()
-            self.play_round()
+        # Change active player
+        self.active_player_index = (active_index + 1) % len(deciders)
 
-        if self.print_info:
-            print("Game Over!")
-            self.print_score_sheets()
+        #update all players scoresheets to reflect locked rows
+        self.lock()
+
+        # Check end conditions
+        if self.check_end_conditions():
+            self.game_over = True
+
+    def play_round_profiled(self, deciders):
+        """play_round_headless, timing each phase into self.timings."""
+        clock = time.perf_counter
+        counts = self.timings.counts
+        seconds = self.timings.seconds
+        start = clock()
+        self.roll_dice()
+        end = clock()
+        counts[0] += 1
+        seconds[0] += end - start
+        active_index = self.active_player_index
+
+        for index in [active_index] + [i for i in range(len(deciders)) if i != active_index]:
+            player, choose_move, needs_state, move_order = deciders[index]
+            start = end
+            if move_order is not None:
+                # lazy moves are generated while the agent decides, so they count as decision time
+                moves = iter_moves(player.score_sheet, self.dice_values, index == active_index, move_order)
+                end = clock()
+                seconds[1] += end - start
+                start = end
+                chosen_move = choose_move(moves)
+            else:
+                possible_moves = self.get_possible_moves(player)
+                end = clock()
+                seconds[1] += end - start
+                start = end
+                if needs_state:
+                    chosen_move = possible_moves[choose_move(possible_moves, self.get_state_key())]
+                else:
+                    chosen_move = possible_moves[choose_move(possible_moves)]
+            end = clock()
+            seconds[2] += end - start
+            if chosen_move == 'Q':
+                self.game_over = True
+                return
+            start = end
+            player.update_score_sheet(chosen_move)
+            self.sheet_changed(player)
+            end = clock()
+            seconds[3] += end - start
+        counts[1] += len(deciders)
+        counts[2] += len(deciders)
+        counts[3] += len(deciders)
+
+        self.active_player_index = (active_index + 1) % len(deciders)
+
+        start = end
+        self.lock()
+        end = clock()
+        seconds[4] += end - start
+        start = end
+        game_over = self.check_end_conditions()
+        seconds[5] += clock() - start
+        counts[4] += 1
+        counts[5] += 1
+        if game_over:
+            self.game_over = True
+
+    def play(self):
+        observer = self.observer
+        if observer is None:
+            # headless: resolve how to ask each player for a move once, up front
+            deciders = [(player, player.choose_move if player.move_order is None else player.choose_from,
+                         player.needs_state, player.move_order) for player in self.players]
+            # profiling has its own round loop, so games without it pay nothing for the timers
+            play_round = self.play_round_headless if self.timings is None else self.play_round_profiled
+            while not self.game_over:
+                play_round(deciders)
+            if self.timings is not None:
+                self.timings.games += 1
+        else:
+            observer.game_started(self)
+            while not self.game_over:
+                observer.round_started(self)
+                self.play_round()
 
         #return scores
         scores = []
         for player in self.players:
-            score = self.calculate_score(player)
-            scores.append(score)
-            if self.print_info:
-                print(f"player {player} score == {score}")
+            scores.append(self.calculate_score(player))
+        if observer is not None:
+            observer.game_ended(self, scores)
 
         #reset the game
         self.refresh()
@@ -361,13 +541,23 @@ class QwixxGame:
 
         return state_representations
     
+    def get_state_key(self):
+        """
+        Immutable, hashable snapshot of the game: (active player index, dice values, packed sheets).
+
+        Each sheet is packed into an int by ScoreSheet.pack(), so a stored state does not
+        change when the game goes on.
+        """
+        return (self.active_player_index, self.dice_values,
+                tuple([player.score_sheet.pack() for player in self.players]))
+
     def win(self, player):
         scores = []
         for player in self.players:
             score = self.calculate_score(player)
             scores.append(score)
         winner_index = scores.index(max(scores))
-        if self.players[winner_index].__class__.__name__ == player.__class__.__name__:
+        if type(self.players[winner_index]) is type(player):
             return True
         else:
             return False
\ No newline at end of file
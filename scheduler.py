@@ -0,0 +1,126 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from dice import DiceStream
+from stats import RunningStats, HeadToHead
+from tournament import play_chunk, CHUNK_SIZE
+
+# games each undecided pairing plays per racing round, split evenly between its seatings
+ROUND_GAMES = 200
+# most games a pairing plays, however close it is
+MAX_GAMES = 5000
+# a pairing is decided once its win rate is known to within this much (see HeadToHead.settled)
+PRECISION = 0.02
+
+
+def rotations(lineup):
+    """Every seating of lineup with its seat order rotated, so each player is once the first to be active."""
+    return [tuple(lineup[start:]) + tuple(lineup[:start]) for start in range(len(lineup))]
+
+
+class LeagueResult:
+    """Head-to-head results between every pair of a pool of agent types, and the scores of each type."""
+    def __init__(self, pool):
+        self.pool = pool
+        self.positions = {player_type: position for position, player_type in enumerate(pool)}
+        self.head_to_head = HeadToHead(len(pool))
+        self.score_stats = [RunningStats() for _ in pool]
+        self.total_games = 0
+
+    def merge(self, seating, games, wins, score_counts, timings=None, cache_lookups=(0, 0), score_stats=(),
+              head_to_head=None, new_decisions=()):
+        """Add a chunk played by play_chunk with the types seated as in seating."""
+        positions = [self.positions[player_type] for player_type in seating]
+        self.total_games += games
+        for position, stats in zip(positions, score_stats):
+            self.score_stats[position].merge(stats)
+        if head_to_head is not None:
+            self.head_to_head.merge(head_to_head, positions)
+
+    def mean_win_rates(self):
+        """Each type's win rate averaged over its opponents, counting ties as half a win."""
+        count = len(self.pool)
+        return [sum(self.head_to_head.win_rate(i, j) for j in range(count) if j != i) / max(count - 1, 1)
+                for i in range(count)]
+
+    def ranking(self):
+        """(type, mean win rate) from best to worst."""
+        return sorted(zip(self.pool, self.mean_win_rates()), key=lambda entry: -entry[1])
+
+    def format(self):
+        lines = ["Ranking (mean win rate, mean score):"]
+        for player_type, rate in self.ranking():
+            lines.append(f"  {player_type}: {rate:.3f}, {self.score_stats[self.positions[player_type]].mean:.2f}")
+        lines.append("Head to head (wins-losses-ties, win rate [95% interval]):")
+        lines.append(self.head_to_head.format(self.pool))
+        return "\n".join(lines)
+
+
+def _play_task(task):
+    seating, games, dice_source, q_table, cache_size = task
+    return play_chunk(seating, games, dice_source, q_table, False, cache_size)
+
+
+def run_league(pool, max_games=MAX_GAMES, precision=PRECISION, round_games=ROUND_GAMES, workers=None, seed=0,
+               chunk_size=CHUNK_SIZE, progress=None, q_table=None, cache_size=0):
+    """
+    Rank a pool of agent types by racing every pair of them in two-player games.
+
+    Each round, every pairing that is not yet settled to `precision` plays `round_games` more games,
+    half in each seating, until it has played `max_games`. Lopsided pairings settle after a round or
+    two, so the games go to the close ones. A round's chunks are dispatched to a pool of worker
+    processes and the round waits for all of them, so the result does not depend on the number of
+    workers. Both seatings of a chunk roll from the same dice substream of DiceStream(seed).
+    `progress` is called with the LeagueResult after each round.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    pool = list(dict.fromkeys(pool))
+    result = LeagueResult(pool)
+    dice_source = DiceStream(seed)
+    index = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        undecided = result.head_to_head.pairings()
+        while undecided:
+            tasks = []
+            for i, j in undecided:
+                seatings = rotations((pool[i], pool[j]))
+                games = min(round_games, max_games - result.head_to_head.games(i, j))
+                per_seating = -(-games // len(seatings))
+                for start in range(0, per_seating, chunk_size):
+                    size = min(chunk_size, per_seating - start)
+                    for seating in seatings:
+                        tasks.append((seating, size, dice_source.spawn(index), q_table, cache_size))
+                    index += 1
+            chunks = executor.map(_play_task, tasks) if executor is not None else map(_play_task, tasks)
+            for task, chunk in zip(tasks, chunks):
+                result.merge(task[0], *chunk)
+            if progress is not None:
+                progress(result)
+            undecided = [(i, j) for i, j in undecided if result.head_to_head.games(i, j) < max_games
+                         and not result.head_to_head.settled(i, j, precision)]
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    # usage: python scheduler.py TYPES... [--games MAX] [--precision P] [--workers N]
+    # e.g.   python scheduler.py greedy heuristic_greedy heuristic_space lookahead table --workers 4
+    args = sys.argv[1:]
+    options = {"--games": MAX_GAMES, "--precision": PRECISION, "--workers": None}
+    for option in list(options):
+        if option in args:
+            position = args.index(option)
+            options[option] = float(args[position + 1]) if option == "--precision" else int(args[position + 1])
+            del args[position:position + 2]
+
+    def progress(result):
+        print(f"Played {result.total_games} games")
+
+    result = run_league(args or ["greedy", "heuristic_greedy", "heuristic_space"], max_games=options["--games"],
+                        precision=options["--precision"], workers=options["--workers"], progress=progress)
+    print(result.format())
@@ -0,0 +1,210 @@
+COLORS = ('Red', 'Yellow', 'Green', 'Blue')
+COLOR_INDEX = {color: i for i, color in enumerate(COLORS)}
+
+# order of a row, stored as a small int
+INCREASING = 0
+DECREASING = 1
+LOCKED = 2
+ORDER_NAMES = ('increasing', 'decreasing', 'locked')
+ORDER_INDEX = {name: i for i, name in enumerate(ORDER_NAMES)}
+
+# number a row starts at, and the number that locks it, for each direction
+START_NUMBER = (0, 13)
+LOCK_NUMBER = (12, 2)
+
+# layout of ScoreSheet.pack(): per row, last_number in 4 bits, order in 2 and x_count in 6,
+# rows from the lowest bits up, then the penalties above the four rows
+ROW_BITS = 12
+PENALTY_SHIFT = 4 * ROW_BITS
+
+
+def packed_row(key, row):
+    """(last_number, order, x_count) of a row in a packed sheet."""
+    field = key >> (ROW_BITS * row)
+    return field & 0xF, (field >> 4) & 0x3, (field >> 6) & 0x3F
+
+
+def pack_row(last_number, order, x_count):
+    """One row as packed in a sheet by pack(), the inverse of packed_row(key, 0)."""
+    return last_number | order << 4 | x_count << 6
+
+
+def packed_penalties(key):
+    return key >> PENALTY_SHIFT
+
+
+def _mark_delta(x_count, order, number):
+    """Score gained by marking number on a row, with the row's x_count and order afterwards."""
+    if order != LOCKED and number == LOCK_NUMBER[order]:
+        new_x_count, order = x_count + 2, LOCKED
+    else:
+        new_x_count = x_count + 1
+    return (new_x_count * (new_x_count + 1) - x_count * (x_count + 1)) // 2, new_x_count, order
+
+
+class RowView:
+    """Dict-like view of one row so code written against the old nested dict keeps working."""
+    __slots__ = ('sheet', 'index')
+
+    def __init__(self, sheet, index):
+        self.sheet = sheet
+        self.index = index
+
+    def __getitem__(self, key):
+        if key == 'last_number':
+            return self.sheet.last_number[self.index]
+        if key == 'x_count':
+            return self.sheet.x_count[self.index]
+        if key == 'order':
+            return ORDER_NAMES[self.sheet.order[self.index]]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'last_number':
+            self.sheet.last_number[self.index] = value
+        elif key == 'x_count':
+            self.sheet.x_count[self.index] = value
+        elif key == 'order':
+            self.sheet.order[self.index] = ORDER_INDEX[value]
+        else:
+            raise KeyError(key)
+        self.sheet.recount()
+
+    def keys(self):
+        return ('last_number', 'order', 'x_count')
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __eq__(self, other):
+        return dict(self.items()) == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class ScoreSheet:
+    """
+    Score sheet stored as fixed-size int lists indexed by row (see COLORS).
+
+    Indexing by color name returns a RowView and 'Penalties' returns the penalty
+    count, so the sheet can be used like the old dict of dicts.
+
+    points (the score of the rows) and locked_mask (bit per locked row) are kept up to
+    date by mark() and lock_rows(); call recount() after writing to the lists directly.
+    """
+    __slots__ = ('last_number', 'x_count', 'order', 'penalties', 'points', 'locked_mask', 'rows')
+
+    def __init__(self):
+        self.last_number = [0, 0, 13, 13]
+        self.x_count = [0, 0, 0, 0]
+        self.order = [INCREASING, INCREASING, DECREASING, DECREASING]
+        self.penalties = 0
+        self.points = 0
+        self.locked_mask = 0
+        self.rows = [RowView(self, i) for i in range(4)]
+
+    def reset(self):
+        """Clear the sheet for a new game, reusing its lists."""
+        self.last_number[:] = (0, 0, 13, 13)
+        self.x_count[:] = (0, 0, 0, 0)
+        self.order[:] = (INCREASING, INCREASING, DECREASING, DECREASING)
+        self.penalties = 0
+        self.points = 0
+        self.locked_mask = 0
+
+    def __getitem__(self, key):
+        if key == 'Penalties':
+            return self.penalties
+        return self.rows[COLOR_INDEX[key]]
+
+    def __setitem__(self, key, value):
+        if key != 'Penalties':
+            raise KeyError(key)
+        self.penalties = value
+
+    def keys(self):
+        return COLORS + ('Penalties',)
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __deepcopy__(self, memo):
+        return self.copy()
+
+    def copy(self):
+        sheet = ScoreSheet.__new__(ScoreSheet)
+        sheet.last_number = self.last_number[:]
+        sheet.x_count = self.x_count[:]
+        sheet.order = self.order[:]
+        sheet.penalties = self.penalties
+        sheet.points = self.points
+        sheet.locked_mask = self.locked_mask
+        sheet.rows = [RowView(sheet, i) for i in range(4)]
+        return sheet
+
+    def mark(self, row, number):
+        order = self.order[row]
+        x_count = self.x_count[row]
+        self.last_number[row] = number
+        if order != LOCKED and number == LOCK_NUMBER[order]:
+            self.x_count[row] = x_count + 2
+            self.order[row] = LOCKED
+            self.locked_mask |= 1 << row
+            self.points += 2 * x_count + 3
+        else:
+            self.x_count[row] = x_count + 1
+            self.points += x_count + 1
+
+    def pack(self):
+        """The whole sheet as one int, see packed_row() and packed_penalties()."""
+        last_number, order, x_count = self.last_number, self.order, self.x_count
+        return (last_number[0] | order[0] << 4 | x_count[0] << 6
+                | (last_number[1] | order[1] << 4 | x_count[1] << 6) << ROW_BITS
+                | (last_number[2] | order[2] << 4 | x_count[2] << 6) << (2 * ROW_BITS)
+                | (last_number[3] | order[3] << 4 | x_count[3] << 6) << (3 * ROW_BITS)
+                | self.penalties << PENALTY_SHIFT)
+
+    def lock_rows(self, mask):
+        """Lock every row whose bit is set in mask."""
+        for row in range(4):
+            if mask >> row & 1:
+                self.order[row] = LOCKED
+        self.locked_mask |= mask
+
+    def recount(self):
+        self.points = 0
+        self.locked_mask = 0
+        for row in range(4):
+            self.points += (self.x_count[row] * (self.x_count[row] + 1)) // 2
+            if self.order[row] == LOCKED:
+                self.locked_mask |= 1 << row
+
+    def score_delta(self, move):
+        """Change in score from applying move, without modifying the sheet."""
+        if move == 'Penalty':
+            return -5
+        if move == 'Pass' or move == 'Q':
+            return 0
+        if type(move[0]) == int:
+            row = COLOR_INDEX[move[1]]
+            return _mark_delta(self.x_count[row], self.order[row], move[0])[0]
+        (number_1, color_1), (number_2, color_2) = move
+        row_1, row_2 = COLOR_INDEX[color_1], COLOR_INDEX[color_2]
+        delta, x_count, order = _mark_delta(self.x_count[row_1], self.order[row_1], number_1)
+        if row_2 != row_1:
+            x_count, order = self.x_count[row_2], self.order[row_2]
+        return delta + _mark_delta(x_count, order, number_2)[0]
+
+    def score(self):
+        # Deduct 5 points for each penalty
+        return self.points - 5 * self.penalties
+
+    def __repr__(self):
+        return repr(dict(self.items()))
@@ -0,0 +1,220 @@
+import asyncio
+import sys
+
+from agents import HumanPlayer
+from dice import DiceStream
+from qwixx import QwixxGame, GameObserver
+
+# opponents a remote human can ask for
+BOT_TYPES = ("greedy", "heuristic_greedy", "heuristic_greedy_odds", "heuristic_space", "lookahead", "table")
+DEFAULT_OPPONENTS = ("heuristic_greedy",)
+
+
+def format_score_sheets(game):
+    lines = ["Current Score Sheets:"]
+    for player in game.players:
+        lines.append(f"{player.name}:")
+        for color, values in player.score_sheet.items():
+            if color == 'Penalties':
+                lines.append(f"  {color}: {values}")
+            elif values['order'] == 'locked':
+                lines.append(f"  {color}: Last Number: {values['last_number']}, X Count: {values['x_count']}, Locked")
+            else:
+                lines.append(f"  {color}: Last Number: {values['last_number']}, X Count: {values['x_count']}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def format_move(move):
+    if move == 'Penalty':
+        return "Take a penalty"
+    if move == 'Q':
+        return "Quit the game"
+    if move == 'Pass':
+        return "Pass"
+    if type(move[0]) == int:
+        return f"{move[0]} in {move[1]}"
+    return f"{move[0][0]} in {move[0][1]} and {move[1][0]} in {move[1][1]}"
+
+
+class StreamObserver(GameObserver):
+    """ConsoleObserver for a remote player: writes the same messages to an asyncio stream."""
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.write((text + "\n").encode())
+
+    def game_started(self, game):
+        self.write("Welcome to Qwixx!")
+
+    def round_started(self, game):
+        self.write(format_score_sheets(game))
+
+    def turn_started(self, game, player):
+        self.write(f"{player.name}'s turn:")
+        self.write("Dice:")
+        for die in game.dice:
+            self.write(f"  {die.color}: {die.value}")
+
+    def move_chosen(self, game, player, move):
+        self.write(f"{player.name} chose: {move}")
+
+    def game_over(self, game, reason):
+        self.write(reason)
+
+    def game_ended(self, game, scores):
+        self.write("Game Over!")
+        self.write(format_score_sheets(game))
+        for player, score in zip(game.players, scores):
+            self.write(f"{player.name} score == {score}")
+
+
+class RemoteHumanPlayer(HumanPlayer):
+    """HumanPlayer whose moves are read from an asyncio stream, one move number per line."""
+    is_async = True
+
+    def __init__(self, reader, writer):
+        super().__init__()
+        self.reader = reader
+        self.writer = writer
+
+    async def choose_move_async(self, possible_moves):
+        lines = ["Possible moves:"]
+        lines += [f"{index}: {format_move(move)}" for index, move in enumerate(possible_moves)]
+        lines.append("Choose a move (enter the corresponding number): ")
+        self.writer.write("\n".join(lines).encode())
+        while True:
+            await self.writer.drain()
+            line = await self.reader.readline()
+            if not line:
+                # the connection closed, so the player quits
+                return possible_moves.index('Q')
+            try:
+                move_choice = int(line)
+                if move_choice < 0 or move_choice >= len(possible_moves):
+                    raise ValueError
+                return move_choice
+            except ValueError:
+                self.writer.write(b"Invalid input. Please try again.\n")
+
+
+class GameSession:
+    """
+    Plays one QwixxGame as a coroutine, so many games can share an event loop.
+
+    Bots decide inline; only agents with is_async set are awaited, so a game between bots never
+    waits on I/O and only gives the other sessions a turn between rounds.
+    """
+    def __init__(self, game):
+        self.game = game
+        self.observer = game.observer if game.observer is not None else GameObserver()
+
+    async def play(self):
+        game = self.game
+        observer = self.observer
+        observer.game_started(game)
+        while not game.game_over:
+            observer.round_started(game)
+            await self.play_round()
+            await asyncio.sleep(0)
+        scores = [game.calculate_score(player) for player in game.players]
+        observer.game_ended(game, scores)
+        return scores
+
+    async def move(self, player):
+        game = self.game
+        if player.move_order is not None:
+            chosen_move = player.choose_from(game.iter_moves(player, player.move_order))
+        else:
+            possible_moves = game.get_possible_moves(player)
+            if player.is_async:
+                move_choice = await player.choose_move_async(possible_moves)
+            elif player.needs_state:
+                move_choice = player.choose_move(possible_moves, game.get_state_key())
+            else:
+                move_choice = player.choose_move(possible_moves)
+            chosen_move = possible_moves[move_choice]
+
+        self.observer.move_chosen(game, player, chosen_move)
+        if chosen_move == 'Q':
+            game.game_over = True
+            return
+        player.update_score_sheet(chosen_move)
+        game.sheet_changed(player)
+
+    async def play_round(self):
+        # QwixxGame.play_round, awaiting the players that decide asynchronously
+        game = self.game
+        game.roll_dice()
+        active_player = game.players[game.active_player_index]
+        self.observer.turn_started(game, active_player)
+
+        await self.move(active_player)
+        if game.game_over:
+            return
+        for other_player in game.players:
+            if other_player is not active_player:
+                await self.move(other_player)
+                if game.game_over:
+                    return
+
+        game.active_player_index = (game.active_player_index + 1) % len(game.players)
+        game.lock()
+        if game.check_end_conditions():
+            game.game_over = True
+
+
+async def handle_client(reader, writer):
+    """One game for a connected human: the first line names the opponents, then one move number per line."""
+    try:
+        writer.write(f"Opponents (any of {', '.join(BOT_TYPES)}), or empty for {' '.join(DEFAULT_OPPONENTS)}:\n".encode())
+        await writer.drain()
+        opponents = tuple((await reader.readline()).decode().lower().split()) or DEFAULT_OPPONENTS
+        if not all(opponent in BOT_TYPES for opponent in opponents):
+            writer.write(f"Unknown opponent in {' '.join(opponents)}\n".encode())
+        else:
+            game = QwixxGame("human", *opponents, observer=StreamObserver(writer))
+            game.players[0] = RemoteHumanPlayer(reader, writer)
+            await GameSession(game).play()
+        await writer.drain()
+    except ConnectionError:
+        # the client went away; a player who disconnects mid-game has already quit it
+        pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def serve(host="127.0.0.1", port=4747):
+    server = await asyncio.start_server(handle_client, host, port)
+    async with server:
+        await server.serve_forever()
+
+
+async def run_bot_games(player_types, games, concurrency=1000, seed=0):
+    """Play `games` bot-only games as concurrent sessions, at most `concurrency` at a time, and return their scores."""
+    dice_source = DiceStream(seed)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def session(index):
+        async with limit:
+            game = QwixxGame(*player_types, dice_source=dice_source.spawn(index))
+            return await GameSession(game).play()
+
+    return await asyncio.gather(*[session(index) for index in range(games)])
+
+
+if __name__ == "__main__":
+    # usage: python server.py [--port N]           host games for humans connecting with e.g. `nc localhost 4747`
+    #        python server.py --bots GAMES types... play bot games as concurrent sessions
+    args = sys.argv[1:]
+    if args and args[0] == "--bots":
+        scores = asyncio.run(run_bot_games(args[2:] or ["greedy", "greedy"], int(args[1])))
+        print(f"Played {len(scores)} games")
+    else:
+        port = int(args[args.index("--port") + 1]) if "--port" in args else 4747
+        asyncio.run(serve(port=port))
@@ -0,0 +1,334 @@
+import mmap
+import struct
+import sys
+import time
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from moves import VALID_SUMS, row_state
+from score_sheet import INCREASING, DECREASING, LOCKED, _mark_delta
+
+# Exact solitaire values for Qwixx: the points a sheet can still expect to score when one player
+# plays it alone and optimally, from backward induction over the joint state of the sheet.
+#
+# In solitaire every roll is the player's own. They may mark the white sum on a row, a white die
+# plus a row's colored die on that row, or the white sum and then a colored sum, as
+# get_possible_moves offers the active player, or take a penalty. The game ends at two locked
+# rows or four penalties.
+#
+# A row's state is its last number and x_count, or locked. Marks are checked with VALID_SUMS and
+# made with _mark_delta, the rules get_possible_moves and ScoreSheet.mark use. Both marks of a
+# pair are checked against the sheet before the move, so a pair on one row can leave it below
+# its first mark: rows reach 110 open states, not the 56 of marking in order. Decreasing rows are
+# mirrored into increasing ones (number -> 14 - number), so every row has the same states.
+#
+# Swapping the two increasing rows, swapping the two decreasing rows, or mirroring the whole
+# sheet (each die d -> 7 - d) keeps its value, so one sheet of each class is solved, numbered by
+# sheet_index(), with a value for each number of penalties. Every move raises the penalties or
+# the sum of the rows' last numbers, so sheets are solved once each, from the highest sum down.
+# That is about 19 million sheets: solve() needs numpy, takes under two hours on one core and
+# writes a 309 MB table, so it is built offline with python solver.py OUTPUT and read by TablePlayer.
+
+# rows 0 and 1 count up and rows 2 and 3 count down (see ScoreSheet)
+MIRRORED = (False, False, True, True)
+MAX_PENALTIES = 4
+PENALTY_POINTS = 5
+# larger than any value a sheet can have, used to rule out moves that are not legal
+UNREACHABLE = 1e6
+
+# Table layout written by save_values() and mapped by load_values():
+#   header  TABLE_MAGIC, then version, row state count, sheet count (little-endian uint32 each)
+#   values  native float32 value of sheet i with p penalties at i * MAX_PENALTIES + p
+TABLE_MAGIC = b'QWXS'
+TABLE_VERSION = 1
+HEADER = struct.Struct('<4sIII')
+# where TablePlayer looks for the table when it is not given one
+TABLE_PATH = 'solitaire.table'
+# sheets solved together by solve()
+BATCH_SIZE = 4096
+
+
+def _mark_row(state, numbers):
+    """(points, state) of marking numbers in turn on an open row state, None for a locked row."""
+    x_count, order = state[1], INCREASING
+    points = 0
+    for number in numbers:
+        gain, x_count, order = _mark_delta(x_count, order, number)
+        points += gain
+    return points, None if order == LOCKED else (numbers[-1], x_count)
+
+
+def _can_mark(state, number):
+    return VALID_SUMS[number][row_state(state[0], INCREASING, state[1])]
+
+
+def _row_states():
+    """Every open (last number, x_count) a row can reach with single marks and pairs, sorted."""
+    states = {(0, 0)}
+    pending = [(0, 0)]
+    while pending:
+        state = pending.pop()
+        numbers = [number for number in range(2, 13) if _can_mark(state, number)]
+        marks = [(number,) for number in numbers] + [(white, colored) for white in numbers
+                                                       for colored in numbers if colored != white]
+        for next_state in (_mark_row(state, marks)[1] for marks in marks):
+            if next_state is not None and next_state not in states:
+                states.add(next_state)
+                pending.append(next_state)
+    return sorted(states)
+
+
+# open row states by index, then the locked state
+ROW_STATES = _row_states()
+ROW_INDEX = {state: index for index, state in enumerate(ROW_STATES)}
+LOCKED_STATE = len(ROW_STATES)
+N_ROW_STATES = LOCKED_STATE + 1
+# last number of each row state, 13 when locked; every move raises one of these
+ROW_LAST = tuple(state[0] for state in ROW_STATES) + (13,)
+
+
+def _mark_tables():
+    # (next state, points) of a single mark and of a pair on one row, -1 when it is not legal
+    mark_next = [-1] * (N_ROW_STATES * 13)
+    mark_points = [0] * (N_ROW_STATES * 13)
+    pair_next = [-1] * (N_ROW_STATES * 13 * 13)
+    pair_points = [0] * (N_ROW_STATES * 13 * 13)
+    for index, state in enumerate(ROW_STATES):
+        numbers = [number for number in range(2, 13) if _can_mark(state, number)]
+        for number in numbers:
+            points, next_state = _mark_row(state, (number,))
+            mark_next[index * 13 + number] = LOCKED_STATE if next_state is None else ROW_INDEX[next_state]
+            mark_points[index * 13 + number] = points
+            for colored in numbers:
+                if colored != number:
+                    points, next_state = _mark_row(state, (number, colored))
+                    key = (index * 13 + number) * 13 + colored
+                    pair_next[key] = LOCKED_STATE if next_state is None else ROW_INDEX[next_state]
+                    pair_points[key] = points
+    return mark_next, mark_points, pair_next, pair_points
+
+
+# MARK_NEXT[state * 13 + number]: row state after marking number (in the increasing direction);
+# PAIR_NEXT[(state * 13 + first) * 13 + second]: after marking two numbers checked against state
+MARK_NEXT, MARK_POINTS, PAIR_NEXT, PAIR_POINTS = _mark_tables()
+
+
+def _pair(a, b):
+    """Index of an unordered pair of ints."""
+    if a > b:
+        a, b = b, a
+    return b * (b + 1) // 2 + a
+
+
+N_PAIRS = _pair(0, N_ROW_STATES)
+N_SHEETS = _pair(0, N_PAIRS)
+
+
+def sheet_index(states):
+    """Index of the class of sheets with these four row states, the same for all of them."""
+    return _pair(_pair(states[0], states[1]), _pair(states[2], states[3]))
+
+
+def row_index(last_number, order, x_count):
+    """Row state of a ScoreSheet row."""
+    if order == LOCKED:
+        return LOCKED_STATE
+    if order == DECREASING:
+        # mirrored; a decreasing row starts at 13 as an increasing one starts at 0
+        last_number = 0 if last_number == 13 else 14 - last_number
+    return ROW_INDEX[last_number, x_count]
+
+
+def sheet_rows(sheet):
+    """Row states of a ScoreSheet."""
+    return [row_index(sheet.last_number[row], sheet.order[row], sheet.x_count[row]) for row in range(4)]
+
+
+def apply_marks(states, marks):
+    """(points, row states) after marks, as (row, number) pairs (see moves.MOVE_MARKS)."""
+    states = list(states)
+    if len(marks) == 2 and marks[0][0] == marks[1][0]:
+        row = marks[0][0]
+        first, second = (14 - number if MIRRORED[row] else number for _, number in marks)
+        key = (states[row] * 13 + first) * 13 + second
+        states[row] = PAIR_NEXT[key]
+        return PAIR_POINTS[key], states
+    points = 0
+    for row, number in marks:
+        key = states[row] * 13 + (14 - number if MIRRORED[row] else number)
+        states[row] = MARK_NEXT[key]
+        points += MARK_POINTS[key]
+    return points, states
+
+
+def sheet_value(values, states, penalties):
+    """Value of a sheet with these row states and penalties; 0 once the game is over."""
+    if penalties >= MAX_PENALTIES or states.count(LOCKED_STATE) >= 2:
+        return 0.0
+    return values[sheet_index(states) * MAX_PENALTIES + penalties]
+
+
+def _unpair(index):
+    """Inverse of _pair for arrays: (a, b) with a <= b."""
+    b = ((np.sqrt(8 * index.astype(np.float64) + 1) - 1) // 2).astype(np.int64)
+    b -= b * (b + 1) // 2 > index
+    b += (b + 1) * (b + 2) // 2 <= index
+    return index - b * (b + 1) // 2, b
+
+
+def _pairs(a, b):
+    high = np.maximum(a, b)
+    return high * (high + 1) // 2 + np.minimum(a, b)
+
+
+def _sheet_states(sheets):
+    """Row states of sheets given by index, as a (sheets, 4) array."""
+    first, second = _unpair(sheets)
+    return np.stack(_unpair(first) + _unpair(second), axis=1)
+
+
+def _solve_sheets(values, states):
+    """Values of a batch of sheets, (sheets, MAX_PENALTIES), from the values of every later sheet."""
+    count = len(states)
+    mark_next = np.array(MARK_NEXT).reshape(N_ROW_STATES, 13)
+    mark_points = np.array(MARK_POINTS, dtype=np.float32).reshape(N_ROW_STATES, 13)
+    pair_next = np.array(PAIR_NEXT).reshape(N_ROW_STATES, 13, 13)
+    pair_points = np.array(PAIR_POINTS, dtype=np.float32).reshape(N_ROW_STATES, 13, 13)
+    # the number each sum 2-12 marks on each row, in the increasing direction
+    numbers = np.array([14 - np.arange(2, 13) if mirrored else np.arange(2, 13) for mirrored in MIRRORED])
+    rows = [states[:, row, None] for row in range(4)]
+
+    def successors(changes, points):
+        # points plus value (count, sums, MAX_PENALTIES) of the sheets with the rows in changes replaced
+        new_rows = list(rows)
+        legal = True
+        for row, next_states in changes:
+            legal = legal & (next_states >= 0)
+            new_rows[row] = np.maximum(next_states, 0)
+        index = _pairs(_pairs(new_rows[0], new_rows[1]), _pairs(new_rows[2], new_rows[3]))
+        return np.where(legal[:, :, None], points[:, :, None] + values[index], -UNREACHABLE)
+
+    # every single mark: next states and points (count, row, sum), and values (count, row, sum, penalties)
+    single_next = mark_next[states[:, :, None], numbers]
+    single_points = mark_points[states[:, :, None], numbers]
+    single = np.stack([successors([(row, single_next[:, row])], single_points[:, row]) for row in range(4)], axis=1)
+
+    # best[white sum][count, row, colored sum, penalties]: best value of a move marking that colored
+    # sum on that row, alone or after the white sum on any row
+    best = []
+    for white in range(11):
+        by_row = []
+        for colored_row in range(4):
+            value = single[:, colored_row]
+            key = states[:, colored_row, None]
+            same_row = successors([(colored_row, pair_next[key, numbers[colored_row, white], numbers[colored_row]])],
+                                  pair_points[key, numbers[colored_row, white], numbers[colored_row]])
+            value = np.maximum(value, same_row)
+            for white_row in range(4):
+                if white_row != colored_row:
+                    white_next = np.broadcast_to(single_next[:, white_row, white, None], (count, 11))
+                    points = single_points[:, white_row, white, None] + single_points[:, colored_row]
+                    value = np.maximum(value, successors([(white_row, white_next),
+                                                          (colored_row, single_next[:, colored_row])], points))
+            by_row.append(value)
+        best.append(np.stack(by_row, axis=1))
+
+    # for each roll of the white dice: its chance, the best white-only value (count, penalties), and the
+    # sorted values of the colored die outcomes (count, penalties, 24) with how likely each is the highest
+    rolls = []
+    for white_1 in range(1, 7):
+        for white_2 in range(white_1, 7):
+            white = white_1 + white_2 - 2
+            # colored die c gives the sums white_1 + c and white_2 + c, at index sum - 2
+            colored = np.maximum(best[white][:, :, white_1 - 1:white_1 + 5], best[white][:, :, white_2 - 1:white_2 + 5])
+            colored = colored.transpose(0, 3, 1, 2).reshape(count, MAX_PENALTIES, 24)
+            order = np.argsort(colored, axis=2)
+            sorted_values = np.take_along_axis(colored, order, axis=2)
+            # chance every die is at most the k-th smallest value: the product of each row's share
+            counts = np.cumsum(order[:, :, :, None] // 6 == np.arange(4), axis=2, dtype=np.int8)
+            at_most = counts[:, :, :-1].prod(axis=3, dtype=np.int16) / np.float32(6 ** 4)
+            rolls.append(((1 if white_1 == white_2 else 2) / 36, single[:, :, white].max(axis=1),
+                          sorted_values, at_most))
+
+    # the penalty option needs the value with one more penalty, so the most penalties come first
+    result = np.zeros((count, MAX_PENALTIES), dtype=np.float32)
+    for penalties in range(MAX_PENALTIES - 1, -1, -1):
+        penalty = -PENALTY_POINTS + (result[:, penalties + 1] if penalties + 1 < MAX_PENALTIES else 0)
+        total = 0
+        for chance, white_only, sorted_values, at_most in rolls:
+            # E[max(X, colored)] = max(X, lowest) + sum over gaps above X of P(colored above the gap)
+            floor = np.maximum(white_only[:, penalties], penalty)[:, None]
+            values_p = sorted_values[:, penalties]
+            gaps = np.maximum(values_p[:, 1:] - np.maximum(values_p[:, :-1], floor), 0)
+            expected = np.maximum(floor[:, 0], values_p[:, 0]) + (gaps * (1 - at_most[:, penalties])).sum(axis=1)
+            total = total + chance * expected
+        result[:, penalties] = total
+    return result
+
+
+def solve(progress=None):
+    """
+    Value of every sheet class for 0 to MAX_PENALTIES - 1 penalties, as a float32 array
+    (N_SHEETS, MAX_PENALTIES). progress is called with each sum of last numbers once it is solved.
+    """
+    if np is None:
+        raise ImportError("solver.solve requires numpy")
+    values = np.zeros((N_SHEETS, MAX_PENALTIES), dtype=np.float32)
+    row_last = np.array(ROW_LAST, dtype=np.int8)
+    # sum of last numbers of every sheet; those with two locked rows are over, and stay at 0
+    level = np.empty(N_SHEETS, dtype=np.int8)
+    for start in range(0, N_SHEETS, 1 << 20):
+        states = _sheet_states(np.arange(start, min(start + (1 << 20), N_SHEETS)))
+        over = (states == LOCKED_STATE).sum(axis=1) >= 2
+        level[start:start + len(states)] = np.where(over, -1, row_last[states].sum(axis=1))
+    for target in range(int(level.max()), -1, -1):
+        sheets = np.flatnonzero(level == target)
+        for start in range(0, len(sheets), BATCH_SIZE):
+            batch = sheets[start:start + BATCH_SIZE]
+            values[batch] = _solve_sheets(values, _sheet_states(batch))
+        if progress is not None:
+            progress(target)
+    return values
+
+
+def save_values(values, path):
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(TABLE_MAGIC, TABLE_VERSION, N_ROW_STATES, N_SHEETS))
+        values.astype(np.float32).tofile(file)
+
+
+def load_values(path):
+    """The values saved at path, memory-mapped read-only as a flat float32 sequence."""
+    with open(path, 'rb') as file:
+        table = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, version, row_states, sheets = HEADER.unpack_from(table)
+    if magic != TABLE_MAGIC or version != TABLE_VERSION or (row_states, sheets) != (N_ROW_STATES, N_SHEETS):
+        raise ValueError(f"{path} is not a version {TABLE_VERSION} solitaire table for these rules")
+    return memoryview(table)[HEADER.size:].cast('f')
+
+
+_shared_values = None
+
+
+def shared_values():
+    """The table at TABLE_PATH, mapped once per process."""
+    global _shared_values
+    if _shared_values is None:
+        try:
+            _shared_values = load_values(TABLE_PATH)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"no solitaire table at {TABLE_PATH}; build it with python solver.py {TABLE_PATH}")
+    return _shared_values
+
+
+if __name__ == "__main__":
+    # usage: python solver.py OUTPUT
+    start_time = time.time()
+
+    def progress(level):
+        print(f"Solved sheets with last numbers summing to {level} ({time.time() - start_time:.0f}s)")
+
+    save_values(solve(progress), sys.argv[1])
+    print(f"Solitaire values saved to {sys.argv[1]}")
@@ -0,0 +1,125 @@
+import math
+
+# z of a two-sided 95% confidence interval
+Z_95 = 1.959964
+
+
+class RunningStats:
+    """
+    Count, mean and variance of a stream of numbers in constant memory (Welford's update).
+
+    merge() combines the stats of two streams (Chan et al.), so workers can keep their own
+    and the results add up as if one process had seen every number.
+    """
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other):
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+
+    def variance(self):
+        """Sample variance, 0 for fewer than two numbers."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def stdev(self):
+        return math.sqrt(self.variance())
+
+    def interval(self, z=Z_95):
+        """(low, high) confidence interval of the mean."""
+        half_width = z * math.sqrt(self.variance() / self.count) if self.count else math.inf
+        return self.mean - half_width, self.mean + half_width
+
+
+def wilson_interval(successes, trials, z=Z_95):
+    """(low, high) Wilson score interval of a proportion; (0, 1) without trials."""
+    if trials == 0:
+        return 0.0, 1.0
+    proportion = successes / trials
+    scale = 1 + z * z / trials
+    center = (proportion + z * z / (2 * trials)) / scale
+    half_width = z * math.sqrt(proportion * (1 - proportion) / trials + z * z / (4 * trials * trials)) / scale
+    return max(center - half_width, 0.0), min(center + half_width, 1.0)
+
+
+class HeadToHead:
+    """
+    Head-to-head matrix of the seats of a game: wins[i][j] is how many games seat i finished
+    with more points than seat j, and ties[i][j] how many they finished level.
+    """
+    def __init__(self, seats):
+        self.seats = seats
+        self.wins = [[0] * seats for _ in range(seats)]
+        self.ties = [[0] * seats for _ in range(seats)]
+
+    def add(self, scores):
+        for i, score in enumerate(scores):
+            wins = self.wins[i]
+            for j in range(i + 1, self.seats):
+                other = scores[j]
+                if score > other:
+                    wins[j] += 1
+                elif score < other:
+                    self.wins[j][i] += 1
+                else:
+                    self.ties[i][j] += 1
+                    self.ties[j][i] += 1
+
+    def merge(self, other, seats=None):
+        """Add other's games; seats[k] is the seat here of other's seat k, when the two seat players differently."""
+        if seats is None:
+            seats = range(other.seats)
+        for i, seat_i in enumerate(seats):
+            for j, seat_j in enumerate(seats):
+                self.wins[seat_i][seat_j] += other.wins[i][j]
+                self.ties[seat_i][seat_j] += other.ties[i][j]
+
+    def pairings(self):
+        return [(i, j) for i in range(self.seats) for j in range(i + 1, self.seats)]
+
+    def games(self, i, j):
+        return self.wins[i][j] + self.wins[j][i] + self.ties[i][j]
+
+    def win_rate(self, i, j):
+        """Share of the games between seats i and j that i won, counting ties as half a win."""
+        games = self.games(i, j)
+        return (self.wins[i][j] + self.ties[i][j] / 2) / games if games else 0.5
+
+    def interval(self, i, j, z=Z_95):
+        """Wilson interval of seat i's win rate against seat j."""
+        return wilson_interval(self.wins[i][j] + self.ties[i][j] / 2, self.games(i, j), z)
+
+    def settled(self, i, j, precision, z=Z_95):
+        """
+        Whether the pairing needs no more games: its interval is at most 2 * precision wide,
+        or it lies entirely on one side of 0.5, so the better of the two seats is clear.
+        """
+        low, high = self.interval(i, j, z)
+        return high - low <= 2 * precision or low > 0.5 or high < 0.5
+
+    def all_settled(self, precision, z=Z_95):
+        return all(self.settled(i, j, precision, z) for i, j in self.pairings())
+
+    def format(self, names, z=Z_95):
+        lines = []
+        for i, j in self.pairings():
+            low, high = self.interval(i, j, z)
+            lines.append(f"  {names[i]} vs {names[j]}: {self.wins[i][j]}-{self.wins[j][i]}-{self.ties[i][j]}, "
+                         f"win rate {self.win_rate(i, j):.3f} [{low:.3f}, {high:.3f}]")
+        return "\n".join(lines)
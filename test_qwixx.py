@@ -1,9 +1,8 @@
 import sys
-import time
-from collections import defaultdict
 
-from qwixx import QwixxGame
-from agents import HumanPlayer, GreedyPlayer, HeuristicGreedyPlayer, HeuristicSpacePlayer, QLearnPlayer
+from decisions import CACHE_SIZE
+from qlearning import load_table
+from tournament import run_tournament
 
 if __name__ == "__main__":
     print("""I'm attempting to determine an optimal strategy for the Game Qwixx. I investigate how two heuristics and Q-learning approach compare against a greedy agent.
@@ -22,36 +21,76 @@ As you can see, these results indicate that the heuristic greedy strategy perfor
 """)
     games = 1000
     run_time = 0
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--time":
-            run_time = int(sys.argv[2])
+    workers = None
+    q_table = None
+    args = sys.argv[1:]
+    # --profile prints how long the games spent in each phase of a round
+    profile = "--profile" in args
+    if profile:
+        args.remove("--profile")
+    cache_size = 0
+    if "--cache" in args:
+        # each worker reuses the decisions of deterministic agents, keeping up to this many
+        position = args.index("--cache")
+        cache_size = int(args[position + 1])
+        del args[position:position + 2]
+    cache_path = None
+    if "--cache-file" in args:
+        # warm-start the decision cache from this snapshot, saving it back with the decisions of this run
+        position = args.index("--cache-file")
+        cache_path = args[position + 1]
+        cache_size = cache_size or CACHE_SIZE
+        del args[position:position + 2]
+    precision = None
+    if "--precision" in args:
+        # stop before the given number of games once each pairing's win rate is known to within this much
+        position = args.index("--precision")
+        precision = float(args[position + 1])
+        del args[position:position + 2]
+    if "--workers" in args:
+        position = args.index("--workers")
+        workers = int(args[position + 1])
+        del args[position:position + 2]
+    if "--q-table" in args:
+        # policy saved by qlearning.py, so q_learn players don't train on their first move
+        position = args.index("--q-table")
+        q_table = load_table(args[position + 1])
+        del args[position:position + 2]
+    if len(args) > 0:
+        if args[0] == "--time":
+            run_time = int(args[1])
             games = 5
         else:
-            games = int(sys.argv[1])
+            games = int(args[0])
     
-    # Initialize the game
-    # options are "greedy", "human", "heuristic_greedy", "heuristic_space", "q_learn"
-    game = QwixxGame("heuristic_space", "heuristic_greedy", "greedy") #Make changes here! 
-    
-    # Define the agents
-    agents = [HeuristicSpacePlayer(), HeuristicGreedyPlayer(), GreedyPlayer()] #make changes here! Options are the imports
-    
-    # Track wins for each agent and total games played
-    wins = {agent.__class__.__name__: 0 for agent in agents}
-    total_games = 0
-    
-    start_time = time.time()
-    
-    while total_games < games or time.time() - start_time < run_time:
-        # Simulate games
-        if total_games % 1000 == 0:
-            print(f"Played {total_games} games. Wins so far: {wins}")
-        batch_results = game.play()  # This will return scores for each player
-        total_games += 1
-        
-        # Determine the winner based on scores
-        winner_index = batch_results.index(max(batch_results))
-        wins[agents[winner_index].__class__.__name__] += 1
+    # Choose the agents
+    # options are "greedy", "human", "heuristic_greedy", "heuristic_greedy_odds", "heuristic_space", "lookahead", "table",
+    # "q_learn"
+    player_types = ("heuristic_space", "heuristic_greedy", "greedy") #Make changes here! 
+
+    # Games are split across worker processes, one per core unless --workers is given
+    printed = 0
+    def progress(result):
+        global printed
+        if result.total_games // 1000 > printed:
+            printed = result.total_games // 1000
+            print(f"Played {result.total_games} games. Wins so far: {result.wins}")
+
+    result = run_tournament(player_types, games=games, run_time=run_time, workers=workers, progress=progress,
+                            q_table=q_table, profile=profile, cache_size=cache_size,
+                            cache_path=cache_path, precision=precision)
 
-    print("Wins:", wins)
-    print("Total Games Played:", total_games)
\ No newline at end of file
+    print("Wins:", result.wins)
+    print("Average scores:", dict(zip(result.names, result.mean_scores())))
+    print("Scores (mean [95% interval], standard deviation):")
+    for name, stats in zip(result.names, result.score_stats):
+        low, high = stats.interval()
+        print(f"  {name}: {stats.mean:.2f} [{low:.2f}, {high:.2f}], {stats.stdev():.2f}")
+    print("Head to head (wins-losses-ties, win rate [95% interval]):")
+    print(result.head_to_head.format(result.names))
+    print("Total Games Played:", result.total_games)
+    if result.timings is not None:
+        print(result.timings.format())
+    if cache_size:
+        lookups = result.cache_hits + result.cache_misses
+        print(f"Decision cache: {result.cache_hits} hits in {lookups} lookups ({result.cache_hits / max(lookups, 1):.1%})")
@@ -0,0 +1,182 @@
+import os
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from decisions import DecisionCache
+from dice import DiceStream
+from qwixx import QwixxGame, PhaseTimings
+from stats import RunningStats, HeadToHead
+
+# games played by a worker per task; each chunk rolls from its own dice substream
+CHUNK_SIZE = 100
+
+# decision cache of this process, kept across chunks when a tournament caches decisions,
+# and the (size, snapshot path) it was made for
+_decision_cache = None
+_decision_cache_setup = None
+
+
+class TournamentResult:
+    def __init__(self, names):
+        self.names = names
+        self.total_games = 0
+        self.wins = {name: 0 for name in names}
+        # score_counts[seat][score] is how many games the player in that seat finished with that score
+        self.score_counts = [Counter() for _ in names]
+        # streaming mean and variance of each seat's score, and which seat beat which
+        self.score_stats = [RunningStats() for _ in names]
+        self.head_to_head = HeadToHead(len(names))
+        # summed per-phase timings of every chunk, when the tournament is profiled
+        self.timings = None
+        # decision cache lookups of every chunk, when the tournament caches decisions
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # DecisionCache collecting the decisions the chunks added, when they are saved as a snapshot
+        self.decisions = None
+
+    def merge(self, games, wins, score_counts, timings=None, cache_lookups=(0, 0), score_stats=(), head_to_head=None,
+              new_decisions=()):
+        self.total_games += games
+        self.cache_hits += cache_lookups[0]
+        self.cache_misses += cache_lookups[1]
+        if self.decisions is not None:
+            self.decisions.update(new_decisions)
+        if timings is not None:
+            if self.timings is None:
+                self.timings = PhaseTimings()
+            self.timings.merge(timings)
+        for name, count in wins.items():
+            self.wins[name] += count
+        for seat, counts in enumerate(score_counts):
+            self.score_counts[seat].update(counts)
+        for seat, stats in enumerate(score_stats):
+            self.score_stats[seat].merge(stats)
+        if head_to_head is not None:
+            self.head_to_head.merge(head_to_head)
+
+    def mean_scores(self):
+        means = []
+        for counts in self.score_counts:
+            games = sum(counts.values())
+            means.append(sum(score * count for score, count in counts.items()) / games if games else 0)
+        return means
+
+    def settled(self, precision):
+        """Whether every pairing of seats is settled to `precision` (see HeadToHead.settled)."""
+        return self.head_to_head.all_settled(precision)
+
+
+def decision_cache(cache_size, cache_path=None):
+    """This process's DecisionCache for a tournament, warm-started from the snapshot at cache_path if there is one."""
+    global _decision_cache, _decision_cache_setup
+    if _decision_cache is None or _decision_cache_setup != (cache_size, cache_path):
+        if cache_path is not None and os.path.exists(cache_path):
+            _decision_cache = DecisionCache.load(cache_path, cache_size)
+        else:
+            _decision_cache = DecisionCache(cache_size)
+        _decision_cache_setup = (cache_size, cache_path)
+    return _decision_cache
+
+
+def play_chunk(player_types, games, dice_source, q_table=None, profile=False, cache_size=0, cache_path=None):
+    # agents that make random choices draw from the global generator, seeded per chunk too
+    random.seed(dice_source.seed)
+    cache = decision_cache(cache_size, cache_path) if cache_size else None
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    if cache is not None and cache_path is not None:
+        # decisions made by this chunk go back with its results, to be saved with the snapshot
+        cache.added = []
+    game = QwixxGame(*player_types, dice_source=dice_source, q_table=q_table, profile=profile, decision_cache=cache)
+    names = [player.name for player in game.players]
+    wins = Counter()
+    score_counts = [Counter() for _ in player_types]
+    score_stats = [RunningStats() for _ in player_types]
+    head_to_head = HeadToHead(len(player_types))
+    for _ in range(games):
+        scores = game.play()
+        wins[names[scores.index(max(scores))]] += 1
+        for seat, score in enumerate(scores):
+            score_counts[seat][score] += 1
+            score_stats[seat].add(score)
+        head_to_head.add(scores)
+    cache_lookups = (cache.hits - hits, cache.misses - misses) if cache is not None else (0, 0)
+    new_decisions = ()
+    if cache is not None and cache.added is not None:
+        new_decisions, cache.added = cache.added, None
+    return games, wins, score_counts, game.timings, cache_lookups, score_stats, head_to_head, new_decisions
+
+
+def run_tournament(player_types, games=1000, run_time=0, workers=None, seed=0, chunk_size=CHUNK_SIZE, progress=None,
+                   q_table=None, profile=False, cache_size=0, cache_path=None, precision=None):
+    """
+    Play games between player_types across a pool of worker processes.
+
+    Plays at least `games` games and keeps going until `run_time` seconds have passed.
+    Games are split into chunks, each rolling dice from its own substream of DiceStream(seed),
+    so a run with a fixed number of games gives the same totals for any number of workers.
+    `progress` is called with the TournamentResult after each chunk is merged.
+    `q_table` is a pre-trained policy for q_learn players (see qlearning.py).
+    With `profile`, the result's timings hold the per-phase timings of every game (see PhaseTimings).
+    With `cache_size`, each worker keeps a decisions.DecisionCache of that size across its chunks,
+    and the result counts its hits and misses.
+    With `cache_path` as well, workers start from the DecisionCache snapshot saved there, if any,
+    and the decisions of this tournament are added to it and saved back when it ends.
+    With `precision`, `games` is only an upper bound: no more chunks are handed out once every
+    pairing of seats is settled to that precision (see TournamentResult.settled). Chunks already
+    queued still finish, so how many games an early stop plays depends on the number of workers.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    result = TournamentResult([player.name for player in QwixxGame(*player_types).players])
+    if cache_size and cache_path is not None:
+        result.decisions = (DecisionCache.load(cache_path, cache_size) if os.path.exists(cache_path)
+                            else DecisionCache(cache_size))
+    dice_source = DiceStream(seed)
+    start_time = time.time()
+    submitted = 0
+    index = 0
+
+    def next_chunk():
+        nonlocal submitted, index
+        if precision is not None and result.settled(precision):
+            return None
+        if submitted < games:
+            size = min(chunk_size, games - submitted)
+        elif time.time() - start_time < run_time:
+            size = chunk_size
+        else:
+            return None
+        submitted += size
+        index += 1
+        return size, dice_source.spawn(index - 1)
+
+    if workers == 1:
+        chunk = next_chunk()
+        while chunk is not None:
+            result.merge(*play_chunk(player_types, *chunk, q_table, profile, cache_size, cache_path))
+            if progress is not None:
+                progress(result)
+            chunk = next_chunk()
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            while True:
+                # keep every worker busy with one chunk queued behind it
+                while len(pending) < 2 * workers:
+                    chunk = next_chunk()
+                    if chunk is None:
+                        break
+                    pending.add(executor.submit(play_chunk, player_types, *chunk, q_table, profile, cache_size,
+                                                cache_path))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result.merge(*future.result())
+                    if progress is not None:
+                        progress(result)
+    if result.decisions is not None:
+        result.decisions.save(cache_path)
+    return result